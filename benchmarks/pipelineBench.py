@@ -0,0 +1,267 @@
+# End-to-end benchmark of the book pipeline against stand-in authority services
+#	A local HTTP server, run in its own process and used as the HTTP proxy, answers every request the pipeline makes:
+#	id.loc.gov search pages and suggest2 json, VIAF AutoSuggest json and the spines themselves, with configurable
+#	latency, error rate and "Temporarily out of service" pages. A synthetic corpus of spine books (mods, emblems,
+#	picturas, stitched page ranges) and their source image trees is generated in a scratch folder, the pipeline is run
+#	over it with metrics on, and books/min, lookups/s, peak RSS and the per-stage times are reported.
+#
+# usage (run from the folder holding the XSL stylesheets, as for the main script):
+#	python benchmarks\pipelineBench.py --books 20 --emblems 50 --latency 80
+#	python benchmarks\pipelineBench.py --books 5 --error-rate 0.05 --outage-rate 0.02 --retry-delay 0.2
+import os, sys, ast, time, json, random, shutil, argparse, tempfile, threading, importlib.util, multiprocessing
+import http.server, urllib.parse
+try:
+	import resource
+except ImportError:
+	resource = None
+
+XSL_FILES = ('spineMods2medusaJson1August.xsl', 'spineMods2rdfJson4Aug.xsl', 'spineEmblem2rdfJson4Aug.xsl')
+SPINE_HOST = 'spines.bench'
+
+# load end2end-rev5Dec2019.py as a module (its file name is not importable); it is registered in sys.modules
+#	so the emblem process pool can find its functions
+def loadPipeline():
+	scriptPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'end2end-rev5Dec2019.py')
+	spec = importlib.util.spec_from_file_location('end2end', scriptPath)
+	pipeline = importlib.util.module_from_spec(spec)
+	sys.modules['end2end'] = pipeline
+	spec.loader.exec_module(pipeline)
+	return pipeline
+
+# Stand-in services. Every term gets one matching record except terms containing "nomatch", so the pipeline's
+#	single-result rules see the same shapes as from the real services
+class FakeServices(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	settings = None
+
+	def log_message(self, *args):
+		pass
+
+	def do_GET(self):
+		settings = self.settings
+		url = urllib.parse.urlsplit(self.path)
+		host = url.hostname or self.headers.get('Host', '')
+		if host != SPINE_HOST:
+			time.sleep(max(0.0, random.gauss(settings['latency'], settings['latency'] * settings['jitter'])))
+			if random.random() < settings['errorRate']:
+				return self.reply(503, b'busy', 'text/plain')
+			if random.random() < settings['outageRate']:
+				return self.reply(200, b'<html><head><title>Temporarily out of service</title></head></html>', 'text/html')
+
+		query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+		if host == SPINE_HOST:
+			spineFile = os.path.join(settings['spineDir'], os.path.basename(url.path))
+			if not os.path.isfile(spineFile):
+				return self.reply(404, b'no such spine', 'text/plain')
+			with open(spineFile, 'rb') as f:
+				return self.reply(200, f.read(), 'application/xml')
+		if 'viaf' in host:
+			term = query.get('query', [''])[0]
+			result = None if 'nomatch' in term.lower() else [{'term' : term, 'displayForm' : term, 'nametype' : 'personal', 'viafid' : str(abs(hash(term)) % 10000000)}]
+			return self.reply(200, json.dumps({'query' : term, 'result' : result}).encode('utf-8'), 'application/json')
+		if url.path.endswith('/suggest2'):
+			if not settings['suggest']:
+				return self.reply(404, b'not found', 'text/plain')
+			term = query.get('q', [''])[0]
+			scheme = url.path[:-len('/suggest2')]
+			hits = [] if 'nomatch' in term else [{'suggestLabel' : term, 'aLabel' : term, 'uri' : 'http://id.loc.gov%s/b%d' % (scheme, abs(hash(term)) % 1000000)}]
+			return self.reply(200, json.dumps({'q' : term, 'count' : len(hits), 'hits' : hits}).encode('utf-8'), 'application/json')
+		if url.path.startswith('/search'):
+			q = query.get('q', [])
+			scheme = q[0].split('id.loc.gov', 1)[-1] if len(q) > 0 else ''
+			term = q[1].split('aLabel:', 1)[-1].strip('"') if len(q) > 1 else ''
+			rows = '' if 'nomatch' in term else '<tbody class="tbody-group"><tr><td><a title="Click to view record" href="%s/b%d.html">%s</a></td></tr></tbody>' % (scheme, abs(hash(term)) % 1000000, term)
+			# a real results page carries plenty of page furniture around the table
+			page = '<html><head><title>Search Results</title></head><body>' + '<div class="nav">&#160;</div>' * 200 + '<table class="id-std"><thead><tr><th>Label</th></tr></thead>' + rows + '</table></body></html>'
+			return self.reply(200, page.encode('utf-8'), 'text/html')
+		return self.reply(404, b'not found', 'text/plain')
+
+	def reply(self, status, body, contentType):
+		self.send_response(status)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+def serveFakeServices(settings, ready):
+	FakeServices.settings = settings
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeServices)
+	server.daemon_threads = True
+	ready.put(server.server_address[1])
+	server.serve_forever()
+
+# write data to folder + '\\' + fleNme the way the pipeline spells source paths; where '\\' is not the path
+#	separator the pipeline's folder is a single name, so the file is also linked into a folder of that name for
+#	its directory index to find
+def writeSourceFile(folder, fleNme, data):
+	path = folder + '\\' + fleNme
+	with open(path, 'wb') as f:
+		f.write(data)
+	if os.sep != '\\':
+		os.makedirs(folder, exist_ok=True)
+		os.link(path, os.path.join(folder, fleNme))
+
+# Generate the corpus in the current folder - spines in spines/, source images under src\<book>, AllBooks-v1.csv
+#	terms are drawn from a shared vocabulary so books repeat each other's lookups as real books do
+def buildCorpus(args):
+	rng = random.Random(args.seed)
+	vocabulary = ['term %d' % i for i in range(args.terms)]
+	for i in range(0, args.terms, 10):
+		vocabulary[i] = 'nomatch term %d' % i
+	names = ['Author%d, Name%d' % (i, i) for i in range(args.terms)]
+	os.makedirs('spines')
+	urls = []
+	jp2 = b'\0' * args.image_bytes
+	jpg = b'\0' * max(1, args.image_bytes // 20)
+	with open('AllBooks-v1.csv', 'w', newline='') as csvFile:
+		for b in range(args.books):
+			book = 'bench%04d' % b
+			source = 'src\\' + book
+			csvFile.write(book + ',' + source + '\r\n')
+			writeSourceFile(source, book + '_marc.xml', b'<record/>')
+
+			subjects = ''.join('<m:subject authority="lcsh"><m:topic>%s</m:topic><m:geographic>%s</m:geographic><m:genre>%s</m:genre></m:subject>' % (rng.choice(vocabulary), rng.choice(vocabulary), rng.choice(vocabulary)) for s in range(args.subjects))
+			nameNodes = ''.join('<m:name><m:namePart>%s</m:namePart><m:role><m:roleTerm>%s</m:roleTerm></m:role></m:name>' % (rng.choice(names), rng.choice(('creator', 'printer', 'engraver'))) for n in range(args.names))
+			mods = ('<m:mods><m:titleInfo><m:title>Book %d</m:title></m:titleInfo>' % b + nameNodes
+				+ '<m:language><m:languageTerm type="code">lat</m:languageTerm></m:language>'
+				+ '<m:originInfo><m:place><m:placeTerm authority="marccountry">gw</m:placeTerm></m:place><m:dateIssued encoding="marc">1550</m:dateIssued></m:originInfo>'
+				+ subjects + '</m:mods>')
+
+			emblems = []
+			page = 10
+			for e in range(args.emblems):
+				emblemId = 'E%06d' % (b * 100000 + e)
+				if rng.random() < args.stitched:
+					imageFile = '%s_%04d-%04d.jp2' % (book, page, page + 1)
+					pages = [page, page + 1]
+				else:
+					imageFile = '%s_%04d.jp2' % (book, page)
+					pages = [page]
+				for p in pages:
+					writeSourceFile(source + '\\JP2Processed', '%s_%04d.jp2' % (book, p), jp2)
+				if len(pages) > 1:
+					writeSourceFile(source + '\\JP2Processed', imageFile, jp2)
+				writeSourceFile(source + '\\JPGthumbnail\\emblem', emblemId + '.jpg', jpg)
+				writeSourceFile(source + '\\JPGthumbnail\\pictura', emblemId + '.jpg', jpg)
+				picturaFile = '%s_%04d.jp2' % (book, pages[0])
+				emblems.append('<e:emblem globalID="EmblemRegistry:%s" xml:id="A%d" xlink:href="http://emblemimages.library.illinois.edu/JP2Processed/%s/%s">'
+					'<e:pictura xlink:href="http://djatoka.grainger.illinois.edu/adore-djatoka/resolver?url_ver=Z39.88-2004&amp;rft_id=http://emblemimages.grainger.illinois.edu/JP2Processed/%s/%s&amp;svc.region=10,20,300,400"/>'
+					'<e:motto><e:transcription xml:lang="la">Motto %d</e:transcription></e:motto></e:emblem>' % (emblemId, e, book, imageFile, book, picturaFile, e))
+				page += len(pages)
+
+			with open(os.path.join('spines', book + '.xml'), 'w', encoding='utf-8') as f:
+				f.write('<e:biblioDesc xmlns:e="http://diglib.hab.de/rules/schema/emblem" xmlns:m="http://www.loc.gov/mods/v3" xmlns:xlink="http://www.w3.org/1999/xlink">'
+					+ mods + ''.join(emblems) + '</e:biblioDesc>')
+			urls.append('http://' + SPINE_HOST + '/' + book + '.xml')
+	return urls
+
+# peak resident set size in MB of this process and of its finished children (None where not available)
+def peakRss():
+	if resource is None:
+		return None, None
+	scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / scale / 1024, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024 / scale / 1024
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Run the book pipeline over a synthetic corpus against stand-in authority services.')
+	parser.add_argument('--books', type=int, default=10)
+	parser.add_argument('--emblems', type=int, default=50, help='emblems per book')
+	parser.add_argument('--subjects', type=int, default=10, help='lcsh subjects per book')
+	parser.add_argument('--names', type=int, default=3, help='names per book')
+	parser.add_argument('--terms', type=int, default=300, help='size of the vocabulary the subject terms and names are drawn from')
+	parser.add_argument('--stitched', type=float, default=0.3, help='share of emblems spanning two pages')
+	parser.add_argument('--image-bytes', type=int, default=64*1024, help='size of each generated jp2')
+	parser.add_argument('--latency', type=float, default=50, help='mean service latency in ms')
+	parser.add_argument('--jitter', type=float, default=0.3, help='latency standard deviation as a share of the mean')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='share of service requests answered 503')
+	parser.add_argument('--outage-rate', type=float, default=0.0, help='share answered with a "Temporarily out of service" page')
+	parser.add_argument('--no-suggest', action='store_true', help='answer suggest2 with 404 so lookups fall back to the search pages')
+	parser.add_argument('--retry-delay', type=float, default=None, help='override the retry backoff base and cap, in seconds')
+	parser.add_argument('--no-rate-limit', action='store_true', help='lift the per-host request rate limits')
+	parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='set a pipeline setting to a Python literal or, failing that, a plain string, e.g. --set BOOK_WORKERS=4 --set LC_BACKEND=html')
+	parser.add_argument('--seed', type=int, default=1)
+	parser.add_argument('--keep', action='store_true', help='keep the scratch folder')
+	parser.add_argument('--json', help='also write the results to this file')
+	args = parser.parse_args(argv)
+
+	xslDir = os.getcwd()
+	for xslFile in XSL_FILES:
+		if not os.path.isfile(xslFile):
+			parser.error(xslFile + ' not found - run from the folder holding the XSL stylesheets')
+	workDir = tempfile.mkdtemp(prefix='emblemBench')
+	server = None
+	try:
+		os.chdir(workDir)
+		for xslFile in XSL_FILES:
+			shutil.copy(os.path.join(xslDir, xslFile), xslFile)
+		urls = buildCorpus(args)
+
+		settings = {'latency' : args.latency / 1000.0, 'jitter' : args.jitter, 'errorRate' : args.error_rate, 'outageRate' : args.outage_rate, 'suggest' : not args.no_suggest, 'spineDir' : os.path.abspath('spines')}
+		ready = multiprocessing.Queue()
+		server = multiprocessing.Process(target=serveFakeServices, args=(settings, ready), daemon=True)
+		server.start()
+		proxy = 'http://127.0.0.1:%d' % ready.get(timeout=30)
+		os.environ['HTTP_PROXY'] = os.environ['http_proxy'] = proxy
+		os.environ['NO_PROXY'] = os.environ['no_proxy'] = ''
+
+		pipeline = loadPipeline()
+		pipeline.dirPrefix = 'out\\'
+		os.makedirs('out', exist_ok=True)
+		pipeline.METRICS_ENABLED = True
+		pipeline.MANIFEST_FILE = None
+		pipeline.LOCAL_AUTHORITY_INDEX = None
+		for setting in args.set:
+			name, value = setting.split('=', 1)
+			try:
+				value = ast.literal_eval(value)
+			except (ValueError, SyntaxError):
+				pass
+			setattr(pipeline, name, value)
+		for policy in pipeline.hostPolicies.values():
+			if args.retry_delay is not None:
+				policy.baseDelay = policy.maxDelay = args.retry_delay
+			if args.no_rate_limit:
+				policy.bucket = pipeline.TokenBucket(None, 1)
+
+		start = time.perf_counter()
+		failedUrls, retryUrls = pipeline.processBooks(urls)
+		wall = time.perf_counter() - start
+		pipeline.finishRun()
+
+		metrics = pipeline.getMetrics()
+		counters = metrics.counters
+		lookups = counters.get('cacheHits', 0) + counters.get('cacheMisses', 0) + counters.get('localIndexHits', 0)
+		selfRss, childRss = peakRss()
+		results = {
+			'books' : len(urls), 'failed' : len(failedUrls), 'retry' : len(retryUrls), 'emblems' : args.books * args.emblems,
+			'seconds' : wall, 'booksPerMinute' : len(urls) * 60 / wall, 'lookups' : lookups, 'lookupsPerSecond' : lookups / wall,
+			'requests' : counters.get('requests', 0), 'retries' : counters.get('retries', 0),
+			'peakRssMB' : selfRss, 'childPeakRssMB' : childRss,
+			'stages' : metrics.stages, 'hosts' : dict((host, {'count' : h['count'], 'meanSeconds' : h['seconds'] / h['count']}) for host, h in metrics.hosts.items())
+		}
+
+		print('books            %d (%d failed, %d to retry), %d emblems' % (results['books'], results['failed'], results['retry'], results['emblems']))
+		print('wall time        %.2f s' % wall)
+		print('books/min        %.1f' % results['booksPerMinute'])
+		print('lookups          %d, %.1f/s - %d requests, %d retries' % (lookups, results['lookupsPerSecond'], results['requests'], results['retries']))
+		if selfRss is not None:
+			print('peak RSS         %.1f MB (largest child process %.1f MB)' % (selfRss, childRss))
+		print('stage times      seconds summed over threads, runs, mean ms')
+		for name, total in sorted(metrics.stages.items(), key=lambda item: -item[1]['seconds']):
+			print('  %-16s %9.2f %7d %9.2f' % (name, total['seconds'], total['count'], total['seconds'] * 1000 / total['count']))
+		for host, h in sorted(results['hosts'].items()):
+			print('  %-16s %7d requests, mean %.1f ms' % (host, h['count'], h['meanSeconds'] * 1000))
+		if args.json:
+			with open(os.path.join(xslDir, args.json), 'w') as f:
+				json.dump(results, f, indent=1)
+	finally:
+		if server is not None:
+			server.terminate()
+		os.chdir(xslDir)
+		if args.keep:
+			print('scratch folder kept: ' + workDir)
+		else:
+			shutil.rmtree(workDir, ignore_errors=True)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,129 @@
+# Micro-benchmark for the XPath work parseXML does per book
+#	Compares the old lookups (tree.xpath with the namespace dict rebuilt and the expression recompiled on every call,
+#	several // scans of the whole document) with the precompiled XP_* expressions and the single BookNodes walk.
+#	Only the lookups are timed - no enrichment, transforms or file copies.
+#
+# usage (run from the folder holding the XSL stylesheets and AllBooks-v1.csv, as for the main script):
+#	python benchmarks\xpathBench.py <spine file or url> [...] [--repeat 20]
+#	python benchmarks\xpathBench.py --synthetic 5000
+import os, sys, time, argparse, importlib.util
+from lxml import etree as ET
+
+# load end2end-rev5Dec2019.py as a module (its file name is not importable)
+def loadPipeline():
+	scriptPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'end2end-rev5Dec2019.py')
+	spec = importlib.util.spec_from_file_location('end2end', scriptPath)
+	pipeline = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(pipeline)
+	return pipeline
+
+# spine with one mods record and emblemCount emblems, shaped like a HAB spine
+def syntheticSpine(emblemCount):
+	emblem = ('<e:emblem globalID="EmblemRegistry:E%06d" xml:id="E%d" xlink:href="http://emblemimages.library.illinois.edu/JP2Processed/bk/bk_%04d.jp2">'
+		'<e:pictura xlink:href="http://djatoka.grainger.illinois.edu/resolver?rft_id=http://emblemimages.grainger.illinois.edu/JP2Processed/bk/bk_%04d.jp2&amp;svc.region=1,2,3,4"/>'
+		'<e:motto><e:transcription xml:lang="la">Motto %d</e:transcription></e:motto><e:subscriptio><e:transcription>Lorem ipsum %d</e:transcription></e:subscriptio></e:emblem>')
+	mods = ('<m:mods><m:name><m:namePart>Alciato, Andrea</m:namePart><m:role><m:roleTerm>creator</m:roleTerm></m:role></m:name>'
+		'<m:language><m:languageTerm type="code">lat</m:languageTerm></m:language>'
+		'<m:originInfo><m:place><m:placeTerm authority="marccountry">gw</m:placeTerm></m:place><m:dateIssued encoding="marc">1550</m:dateIssued></m:originInfo>'
+		+ '<m:subject authority="lcsh"><m:topic>Emblems</m:topic><m:geographic>Italy</m:geographic><m:genre>Poetry</m:genre></m:subject>' * 20 + '</m:mods>')
+	body = ''.join(emblem % (i, i, i, i, i, i) for i in range(emblemCount))
+	return ('<e:biblioDesc xmlns:e="http://diglib.hab.de/rules/schema/emblem" xmlns:m="http://www.loc.gov/mods/v3" xmlns:xlink="http://www.w3.org/1999/xlink">'
+		+ mods + body + '</e:biblioDesc>').encode('utf-8')
+
+# the lookups as parseXML made them before the XPath expressions were precompiled
+def oldLookups(tree):
+	nsM = lambda: {'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'}
+	nsX = lambda: {'e': 'http://diglib.hab.de/rules/schema/emblem', 'x': 'http://www.w3.org/1999/xlink'}
+	nsXL = lambda: {'e': 'http://diglib.hab.de/rules/schema/emblem', 'xlink': 'http://www.w3.org/1999/xlink'}
+	found = 0
+	for i in range(2):
+		found += len(tree.xpath('//e:biblioDesc', namespaces=nsM()))
+		found += len(tree.xpath('//m:mods', namespaces=nsM()))
+	found += len(tree.xpath("//e:emblem[@x:href]", namespaces=nsX()))
+	for pictura in tree.xpath("//e:emblem/e:pictura[@x:href]", namespaces=nsX()):
+		found += len(pictura.xpath("@x:href", namespaces=nsX()))
+	for lang in tree.xpath('//m:mods/m:language', namespaces=nsM()):
+		found += len(lang.xpath("m:languageTerm[@type='code']", namespaces=nsM()))
+	for place in tree.xpath('//m:mods/m:originInfo/m:place', namespaces=nsM()):
+		found += len(place.xpath("m:placeTerm[@authority='marccountry']", namespaces=nsM()))
+	for sub in tree.xpath('//m:mods/m:subject[@authority="lcsh"]', namespaces=nsM()):
+		for xp in ('m:topic', 'm:geographic', 'm:genre', 'm:name'):
+			found += len(sub.xpath(xp, namespaces=nsM()))
+	for nme in tree.xpath('//m:mods/m:name', namespaces=nsM()):
+		for xp in ('m:namePart', 'm:displayForm', 'm:role/m:roleTerm'):
+			found += len(nme.xpath(xp, namespaces=nsM()))
+	found += len(tree.xpath("//m:mods/m:originInfo/m:dateIssued[@encoding='marc' or @encoding='iso8601']", namespaces=nsM()))
+	found += len(tree.xpath("//m:mods/m:originInfo/m:dateIssued", namespaces=nsM()))
+	for emblem in tree.xpath('//e:emblem', namespaces=nsM()):
+		emblemTree = ET.ElementTree(emblem)
+		found += len(emblemTree.xpath('substring-after(/e:emblem/@globalID,"EmblemRegistry:")', namespaces=nsM())) > 0
+		found += len(emblemTree.xpath('string(/e:emblem/@xml:id)', namespaces=nsM())) > 0
+		found += len(emblemTree.xpath("string(/e:emblem/e:pictura/@xlink:href)", namespaces=nsXL())) > 0
+		found += len(emblemTree.xpath("string(/e:emblem/@xlink:href)", namespaces=nsXL())) > 0
+	return found
+
+# the same lookups through BookNodes and the precompiled XP_* expressions
+def newLookups(pipeline, tree):
+	nodes = pipeline.BookNodes(tree.getroot())
+	found = 2 * (len(nodes.biblioDescs) + len(nodes.mods))
+	found += len(nodes.emblemsWithHref())
+	found += sum(1 for pictura in nodes.picturas if pictura.get(pipeline.XLINK_HREF) is not None)
+	found += sum(len(pipeline.XP_LANGUAGE_CODE(lang)) for lang in nodes.languages)
+	found += sum(len(pipeline.XP_PLACE_MARCCOUNTRY(place)) for place in nodes.places)
+	for sub in nodes.subjects:
+		for xp in (pipeline.XP_TOPIC, pipeline.XP_GEOGRAPHIC, pipeline.XP_GENRE, pipeline.XP_NAME):
+			found += len(xp(sub))
+	for nme in nodes.names:
+		found += len(pipeline.XP_NAMEPART(nme)) + len(pipeline.XP_DISPLAYFORM(nme)) + len(nodes.roleTerms[nme])
+	found += len(nodes.codedDatesIssued()) + len(nodes.datesIssued)
+	for emblem in nodes.emblems:
+		found += len(pipeline.XP_EMBLEM_ID(emblem)) > 0
+		found += len(pipeline.XP_EMBLEM_XMLID(emblem)) > 0
+		found += len(pipeline.XP_EMBLEM_PICTURA_HREF(emblem)) > 0
+		found += len(pipeline.XP_EMBLEM_HREF(emblem)) > 0
+	return found
+
+# CPU seconds per call of fn, best of repeat runs
+def cpuTime(fn, repeat):
+	best = None
+	for i in range(repeat):
+		start = time.process_time()
+		fn()
+		elapsed = time.process_time() - start
+		best = elapsed if best is None or elapsed < best else best
+	return best
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Time the per-book XPath lookups of parseXML, old against precompiled.')
+	parser.add_argument('spines', nargs='*', help='spine / mods files or urls')
+	parser.add_argument('--synthetic', type=int, default=0, help='also time a generated spine with this many emblems')
+	parser.add_argument('--repeat', type=int, default=20)
+	args = parser.parse_args(argv)
+
+	pipeline = loadPipeline()
+	books = []
+	for spine in args.spines:
+		if spine.startswith('http://') or spine.startswith('https://'):
+			books.append((spine, pipeline.httpGet(spine).content))
+		else:
+			with open(spine, 'rb') as f:
+				books.append((spine, f.read()))
+	if args.synthetic > 0:
+		books.append(('synthetic, ' + str(args.synthetic) + ' emblems', syntheticSpine(args.synthetic)))
+	if len(books) == 0:
+		parser.error('give at least one spine or --synthetic N')
+
+	print('%-50s %8s %10s %10s %10s' % ('book', 'emblems', 'old ms', 'new ms', 'saved ms'))
+	for name, spine in books:
+		root = ET.fromstring(spine)
+		biblioDesc = next(root.iter(pipeline.E_NS+'biblioDesc'), None)
+		tree = ET.ElementTree(biblioDesc if biblioDesc is not None else root)
+		if oldLookups(tree) != newLookups(pipeline, tree):
+			print(name + ': old and new lookups disagree')
+		old = cpuTime(lambda: oldLookups(tree), args.repeat)
+		new = cpuTime(lambda: newLookups(pipeline, tree), args.repeat)
+		emblemCount = len(pipeline.BookNodes(tree.getroot()).emblems)
+		print('%-50s %8d %10.2f %10.2f %10.2f' % (name[-50:], emblemCount, old*1000, new*1000, (old-new)*1000))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -1,12 +1,32 @@
 # import required modules / packages
-import os, sys, requests, time, urllib, json, uuid, re, datetime, csv, threading, logging, html
+import os, sys, requests, time, urllib, urllib.parse, json, uuid, re, datetime, csv, threading, logging, html, random, email.utils, hashlib
 import os.path
 import shutil
+import requests.adapters
+import sqlite3
+import gzip
+import io
+import tempfile
+import copy
+import concurrent.futures
+import queue
+import socket
+import contextlib
+import contextvars
+import functools
+import argparse
+import cProfile
+import pstats
+import tracemalloc
 from lxml import etree as ET
 from html.parser import HTMLParser
-from unicodedata import normalize
+from unicodedata import normalize, combining
 from datetime import timedelta
-from mysql.connector import MySQLConnection
+from mysql.connector.pooling import MySQLConnectionPool
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
 
 # Global Constants
 BASE_VIAF_URL = 'http://www.viaf.org/viaf/AutoSuggest?query='
@@ -16,10 +36,228 @@ BASE_LC_Subjects = 'http://id.loc.gov/search/?q=scheme:http://id.loc.gov/authori
 BASE_LC_MARCGAC = 'http://id.loc.gov/search/?q=scheme:http://id.loc.gov/vocabulary/geographicAreas&q=aLabel:'
 BASE_LC_NmeSubjects = 'http://id.loc.gov/search/?q=scheme:http://id.loc.gov/authorities/names&q=aLabel:'
 BASE_LC_genreSubjects = 'http://id.loc.gov/search/?q=scheme:http://id.loc.gov/authorities/genreForms&q=aLabel:'
+
+# Authority lookup cache - answers from getRequest are kept in a SQLite file so reruns do not query
+#	id.loc.gov / VIAF again for terms already resolved. TTLs are in seconds and picked by the first
+#	CACHE_TTL key found in the query URL; 404s and "no match" answers expire after CACHE_NEGATIVE_TTL
+CACHE_ENABLED = True
+CACHE_FILE = 'authorityCache.sqlite'
+CACHE_TTL = {
+'viaf.org' : 30*86400,
+'vocabulary/relators' : 365*86400,
+'vocabulary/countries' : 365*86400,
+'vocabulary/geographicAreas' : 365*86400,
+'authorities/genreForms' : 180*86400,
+'authorities/subjects' : 90*86400,
+'authorities/names' : 30*86400
+}
+CACHE_DEFAULT_TTL = 30*86400
+CACHE_NEGATIVE_TTL = 7*86400
+
+# Local authority index - labels imported from the id.loc.gov and VIAF bulk downloads (see importAuthorities) into a
+#	SQLite file, keyed by normalized label. getRequest answers authority searches from it before the cache and the
+#	network, but only with the records whose label is the searched one. The service would also list records whose label
+#	merely holds the searched words (id.loc.gov) or starts with them (VIAF), and ranks them its own way, so
+#	LOCAL_AUTHORITY_MODE 'first' answers a search only when exactly one record has the label and the index holds no
+#	other label the search would list - everything else goes on to the cache and the service. 'only' answers every
+#	search from the exact label, labels the index does not hold being no match, so a run needs no network at all but
+#	can decide differently from the service. The index is used only once the file has been imported
+LOCAL_AUTHORITY_INDEX = 'authorityIndex.sqlite'
+LOCAL_AUTHORITY_MODE = 'first'
+
+# Name memo - personal and corporate name searches (VIAF AutoSuggest and id.loc.gov names) are resolved once per run
+#	for each nameKey: spellings that differ only in diacritics, case, punctuation, spacing or the way a date suffix is
+#	written share the answer of the first one looked up
+NAME_MEMO = True
+
+# id.loc.gov lookups - LC_BACKEND 'html' scrapes the search page. 'json' asks the suggest2 service (a small json list of
+#	labels and record URIs) first and answers from it only when its hits prove the search page would list exactly one
+#	record, with the searched label (see fetchLcSuggest); every other search - no hit, several records, any other label -
+#	falls back to the search page, so both backends make the same matching decisions. LC_SUGGEST_COUNT is the number of
+#	hits asked for
+LC_BACKEND = 'json'
+LC_SUGGEST_COUNT = 50
+
+# Retry policy per service for fetchRequest
+#	attempts - tries before giving up on a query; baseDelay, maxDelay - bounds in seconds of the jittered exponential backoff
+#	rate, burst - token bucket, requests per second and bucket size (None = no rate limit, an explicit opt-out). The
+#	bucket caps every book and lookup worker together, so the rates are set above what HOST_LIMITS lets through at
+#	ordinary response times (4 requests in flight to id.loc.gov, 2 to viaf.org, at about 200 ms each) - they only bite
+#	when the services answer unusually fast, and a low rate makes a book with 40 lookups spend seconds waiting
+#	failureThreshold - consecutive failed requests that open the host's circuit; cooldown - seconds an open circuit fails fast
+RETRY_POLICY = {
+'id.loc.gov' : {'attempts' : 6, 'baseDelay' : 2, 'maxDelay' : 60, 'rate' : 25, 'burst' : 10, 'failureThreshold' : 8, 'cooldown' : 300},
+'viaf.org' : {'attempts' : 6, 'baseDelay' : 2, 'maxDelay' : 60, 'rate' : 12, 'burst' : 4, 'failureThreshold' : 8, 'cooldown' : 300}
+}
+DEFAULT_RETRY_POLICY = {'attempts' : 4, 'baseDelay' : 2, 'maxDelay' : 30, 'rate' : None, 'burst' : 1, 'failureThreshold' : 8, 'cooldown' : 120}
+# books that could not be finished because a service was unavailable are written here, in the same format as the url list
+RETRY_LIST_FILE = 'retryList.json'
+# emblem thumbnails and page images not found in a book's source directory are listed here at the end of the run
+MISSING_IMAGES_FILE = 'missingImages.csv'
+
+# HTTP settings - all outbound requests go through httpGet and share one set of keep-alive connection pools
+#	HTTP_POOL_CONNECTIONS - number of hosts kept pooled; HTTP_POOL_MAXSIZE - connections kept alive per host
+#	HTTP_TIMEOUT - (connect, read) timeouts in seconds; HTTP_COMPRESSION - ask services for gzip/deflate responses
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 16
+HTTP_TIMEOUT = (10, 60)
+HTTP_COMPRESSION = True
+
+# Run settings - output root, and how many books from the url list are processed at once (1 = one after another)
+dirPrefix = "E:\\emblemimages-wwwroot\\"
+BOOK_WORKERS = 1
+# the url list processed by default, and the book id -> source folder list the images and marc records are copied from
+BOOK_LIST_FILE = 'myList20Oct.json'
+BOOK_LOCATIONS_FILE = 'AllBooks-v1.csv'
+# watch mode - the folder url lists are dropped into, and how often it is checked, in seconds
+WATCH_QUEUE_DIR = 'queue'
+WATCH_INTERVAL = 5
+
+# Job queue - a SQLite file of book urls (JOB_QUEUE_FILE, kept where every worker host can reach it, e.g. on the output
+#	volume) shared by the processes running 'jobs work'. A worker leases a book for JOB_LEASE seconds and renews its leases
+#	every JOB_HEARTBEAT seconds; a lease left to run out - its worker died - is taken over by the next worker that looks.
+#	A book is tried at most JOB_MAX_ATTEMPTS times. Workers with nothing to take wait JOB_POLL seconds for other workers'
+#	books to finish (or their leases to run out) and stop once the queue is drained
+JOB_QUEUE_FILE = 'jobQueue.sqlite'
+JOB_LEASE = 600
+JOB_HEARTBEAT = 60
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL = 30
+# read spines with iterparse and handle each emblem as it arrives, keeping memory flat for very large books
+STREAM_EMBLEMS = False
+# worker processes for the emblem rdf transforms, 0 runs them in the book's own thread
+EMBLEM_PROCESSES = 0
+# worker processes of the render command, each re-rendering one book at a time (None = one per cpu)
+RENDER_PROCESSES = None
+
+# Spine prefetch - PREFETCH_WORKERS threads download spines ahead of the books being processed, holding at most
+#	PREFETCH_DEPTH fetched spines waiting (0 fetches each spine in its book's own thread). Spines are kept in
+#	SPINE_CACHE_DIR with their ETag / Last-Modified, so a later run sends conditional requests and only downloads
+#	the spines that changed. None turns the cache off
+PREFETCH_WORKERS = 2
+PREFETCH_DEPTH = 4
+SPINE_CACHE_DIR = 'spineCache'
+
+# Image copies - a book's jp2 and thumbnail copies are queued and run COPY_WORKERS at a time across all books.
+#	A destination whose size and modification time already match its source is left alone.
+#	COPY_MODE 'copy' copies the file, 'hardlink' links it (source and destination on the same volume) and 'reflink'
+#	clones it where the file system supports it; both fall back to a plain copy when linking fails
+COPY_WORKERS = 8
+COPY_MODE = 'copy'
+
+# Fixity - with FIXITY_MANIFEST a plain copy reads its source once, COPY_BUFFER bytes at a time, hashing them (SHA-256 and
+#	MD5) as they are written. Every file in a book's preservation folder is listed with its size, hashes and source in
+#	supplementary\<dirNme>_fixity.csv, and a later copy to a destination the manifest shows already holding that source's
+#	content is skipped without reading either file. Each content hash is copied into the folder once: a source the size
+#	of a file already listed is hashed first, and when the folder holds its content the destination is hard linked to
+#	that file instead of copied (a duplicate still being copied by another worker is copied again)
+FIXITY_MANIFEST = True
+COPY_BUFFER = 1024*1024
+
+# Run manifest - per book, the hashes of its inputs and the stages it has finished. A book whose spine, xsl files and
+#	ENRICHMENT_VERSION match a completed entry is skipped; one interrupted part way resumes after its last finished stage.
+#	Bump ENRICHMENT_VERSION whenever the enrichment rules or the cached authority answers change. None turns the manifest off
+MANIFEST_FILE = 'runManifest.json'
+ENRICHMENT_VERSION = 1
+XSL_FILES = ('spineMods2medusaJson1August.xsl', 'spineMods2rdfJson4Aug.xsl', 'spineEmblem2rdfJson4Aug.xsl')
+BOOK_STAGES = ('marc', 'enrich', 'book', 'emblems')
+
+# Metrics - with METRICS_ENABLED the run times its stages, the requests to each host and counts retries, cache hits and
+#	copied bytes. At the end of the run they are written to METRICS_FILE (json - run totals and an entry per book) and
+#	METRICS_PROM_FILE (Prometheus textfile). METRICS_BUCKETS are the upper bounds in seconds of the latency histograms
+METRICS_ENABLED = False
+METRICS_FILE = 'runMetrics.json'
+METRICS_PROM_FILE = 'emblematica.prom'
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Profiling - with PROFILE_BOOKS each book's parseXML runs under cProfile and tracemalloc. A book that takes longer than
+#	PROFILE_SECONDS or whose traced memory grows by more than PROFILE_MEMORY_MB keeps its profile in
+#	supplementary\<dirNme>_profile.prof and a report in supplementary\<dirNme>_profile.txt - the PROFILE_TOP functions by
+#	cumulative time and allocation sites (PROFILE_FRAMES frames deep). Every profiled book is ranked, slowest and heaviest
+#	first, in PROFILE_RANKING_FILE. tracemalloc's peak is process wide, so profiled books go through parseXML one at a time
+PROFILE_BOOKS = False
+PROFILE_SECONDS = 120
+PROFILE_MEMORY_MB = 256
+PROFILE_TOP = 25
+PROFILE_FRAMES = 5
+PROFILE_RANKING_FILE = 'bookProfiles.txt'
+
+# RDF stream - with RDF_STREAM_FILE set, every book and emblem json-ld document written to supplementary is also appended
+#	as one line to the run's NDJSON stream, RDF_STREAM_FILE-<part>.ndjson, or .ndjson.gz with RDF_STREAM_GZIP (each line
+#	its own gzip member, so one document can be read without the rest). A part is closed and the next one started once
+#	it passes RDF_STREAM_MAX_BYTES. RDF_STREAM_FILE.index lists every document - kind, book, document id, part, offset, length
+RDF_STREAM_FILE = None
+RDF_STREAM_GZIP = True
+RDF_STREAM_MAX_BYTES = 512*1024*1024
+
+# Enrichment results - every term the enrichment looks up is recorded (book, term type, term, match count, chosen
+#	valueURI, lookup latency, cache hit) and written RESULTS_BATCH_SIZE rows at a time to RESULTS_SINK: 'sqlite' (RESULTS_FILE),
+#	'mysql' (RESULTS_MYSQL, through a pool of RESULTS_MYSQL_POOL_SIZE connections), 'csv' (RESULTS_FILE, one file for the run)
+#	or None to not record them
+RESULTS_SINK = 'sqlite'
+RESULTS_FILE = 'enrichmentResults.sqlite'
+RESULTS_BATCH_SIZE = 500
+RESULTS_MYSQL = {'host' : 'localhost', 'database' : 'emblematica', 'user' : 'emblematica', 'password' : os.environ.get('EMBLEMATICA_DB_PASSWORD', '')}
+RESULTS_MYSQL_POOL_SIZE = 4
+
+# Authority resolution - distinct terms of a book are looked up RESOLVE_WORKERS at a time,
+#	with at most HOST_LIMITS[host] requests in flight to each service across all books
+RESOLVE_WORKERS = 8
+HOST_LIMITS = {
+'id.loc.gov' : 4,
+'viaf.org' : 2
+}
+# Warm-up - with WARM_UP every spine of a url list is parsed before any book is processed, and the distinct authority
+#	queries of the whole list are resolved into the authority cache in one pass, WARM_UP_WORKERS at a time
+WARM_UP = False
+WARM_UP_WORKERS = 32
  
-transform = ET.XSLT(ET.parse('spineMods2medusaJson1August.xsl'))
-transformMods2Rdf = ET.XSLT(ET.parse('spineMods2rdfJson4Aug.xsl'))
-transformEmblem2Rdf = ET.XSLT(ET.parse('spineEmblem2rdfJson4Aug.xsl'))
+# the main thread's compiled XSLTs - compiled by getTransforms on first use
+transform = None
+transformMods2Rdf = None
+transformEmblem2Rdf = None
+
+# Namespaces and precompiled XPath expressions - compiled once here rather than on every call in parseXML.
+#	All are evaluated relative to the element they are called on; the whole-tree (//) scans are done in a single
+#	walk by BookNodes instead
+NS = {'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3', 'x': 'http://www.w3.org/1999/xlink', 'xlink': 'http://www.w3.org/1999/xlink'}
+E_NS = '{http://diglib.hab.de/rules/schema/emblem}'
+M_NS = '{http://www.loc.gov/mods/v3}'
+XLINK_HREF = '{http://www.w3.org/1999/xlink}href'
+XSI_SCHEMA_LOCATION = '{http://www.w3.org/2001/XMLSchema-instance}schemaLocation'
+SPINE_SCHEMA_LOCATION = "http://www.loc.gov/mods/v3 http://www.loc.gov/standards/mods/mods.xsd http://diglib.hab.de/rules/schema/emblem http://diglib.hab.de/rules/schema/emblem/emblem-1-2.xsd"
+MODS_SCHEMA_LOCATION = "http://www.loc.gov/mods/v3 http://www.loc.gov/standards/mods/mods.xsd"
+XP_LANGUAGE_CODE = ET.XPath("m:languageTerm[@type='code']", namespaces=NS)
+XP_PLACE_MARCCOUNTRY = ET.XPath("m:placeTerm[@authority='marccountry']", namespaces=NS)
+XP_TOPIC = ET.XPath('m:topic', namespaces=NS)
+XP_GEOGRAPHIC = ET.XPath('m:geographic', namespaces=NS)
+XP_GENRE = ET.XPath('m:genre', namespaces=NS)
+XP_NAME = ET.XPath('m:name', namespaces=NS)
+XP_NAMEPART = ET.XPath('m:namePart', namespaces=NS)
+XP_DISPLAYFORM = ET.XPath('m:displayForm', namespaces=NS)
+XP_EMBLEM_ID = ET.XPath('substring-after(@globalID,"EmblemRegistry:")', namespaces=NS)
+XP_EMBLEM_XMLID = ET.XPath('string(@xml:id)', namespaces=NS)
+XP_EMBLEM_HREF = ET.XPath('string(@xlink:href)', namespaces=NS)
+XP_EMBLEM_PICTURA_HREF = ET.XPath('string(e:pictura/@xlink:href)', namespaces=NS)
+XP_LC_ROWS = ET.XPath("//table[@class='id-std']/tbody/tr")
+XP_LC_GROUPS = ET.XPath("//table[@class='id-std']/tbody[@class='tbody-group']")
+XP_LC_RECORD_HREF = ET.XPath("./td/a[@title='Click to view record']/@href")
+
+# compiled XSLTs are not shared between threads - the main thread and each book worker thread compile their own copy
+#	on first use. The book workers are kept for the life of the process, so their copies are compiled once per run
+xslLocal = threading.local()
+def compileTransforms():
+	return tuple(ET.XSLT(ET.parse(xslFile)) for xslFile in XSL_FILES)
+
+def getTransforms():
+	global transform, transformMods2Rdf, transformEmblem2Rdf
+	if threading.current_thread() is threading.main_thread():
+		if transform is None:
+			transform, transformMods2Rdf, transformEmblem2Rdf = compileTransforms()
+		return transform, transformMods2Rdf, transformEmblem2Rdf
+	if not hasattr(xslLocal, 'transforms'):
+		xslLocal.transforms = compileTransforms()
+	return xslLocal.transforms
 
 # Global Mappings
 relators = {
@@ -51,12 +289,75 @@ genreSubjects = {
 }
 
 
+# book id -> source folder, from BOOK_LOCATIONS_FILE - read on first use and again whenever the file changes, so a
+#	long-running worker picks up books added to it
 oldPaths = {}
-# open the csv, iterate through it and populate the dictionary
-with open('AllBooks-v1.csv', 'r', newline='') as myCsvFile:
-	myCsvRdr = csv.DictReader(myCsvFile, delimiter=',', fieldnames=['bookId', 'bookLocation'])	
-	for myRow in myCsvRdr :
-		oldPaths[myRow['bookId']] = myRow['bookLocation']	
+oldPathsStamp = None
+oldPathsLock = threading.Lock()
+
+def getOldPaths():
+	global oldPaths, oldPathsStamp
+	stamp = os.stat(BOOK_LOCATIONS_FILE).st_mtime
+	if stamp != oldPathsStamp:
+		with oldPathsLock:
+			if stamp != oldPathsStamp:
+				paths = {}
+				# open the csv, iterate through it and populate the dictionary
+				with open(BOOK_LOCATIONS_FILE, 'r', newline='') as myCsvFile:
+					myCsvRdr = csv.DictReader(myCsvFile, delimiter=',', fieldnames=['bookId', 'bookLocation'])	
+					for myRow in myCsvRdr :
+						paths[myRow['bookId']] = myRow['bookLocation']	
+				oldPaths = paths
+				oldPathsStamp = stamp
+	return oldPaths
+
+# Index of the files in a book's source directory (its location in AllBooks-v1.csv) - one os.scandir pass over each
+#	folder images and marc records are copied from, shared by every book with that source. Names go through
+#	os.path.normcase so lookups are case-insensitive on Windows, as the exists / isfile probes they replace were
+SOURCE_FOLDERS = ('', 'JP2Processed', 'JPGthumbnail\\emblem', 'JPGthumbnail\\pictura')
+class SourceIndex:
+	def __init__(self, sourceDirectory):
+		self.files = {}
+		for folder in SOURCE_FOLDERS:
+			names = set()
+			try:
+				with os.scandir(sourceDirectory + '\\' + folder if folder else sourceDirectory) as entries:
+					for entry in entries:
+						if entry.is_file():
+							names.add(os.path.normcase(entry.name))
+			except OSError:
+				pass
+			self.files[folder] = names
+
+	def has(self, folder, fleNme):
+		return os.path.normcase(fleNme) in self.files[folder]
+
+sourceIndexes = {}
+sourceIndexesLock = threading.Lock()
+
+def getSourceIndex(sourceDirectory):
+	with sourceIndexesLock:
+		index = sourceIndexes.get(sourceDirectory)
+		if index is None:
+			index = SourceIndex(sourceDirectory)
+			sourceIndexes[sourceDirectory] = index
+	return index
+
+# forget the source listings at a job boundary - images may have been added since, and a long-running worker would
+#	otherwise keep every listing it ever made
+def clearSourceIndexes():
+	with sourceIndexesLock:
+		sourceIndexes.clear()
+
+# images an emblem refers to that are not in its book's source, written to MISSING_IMAGES_FILE by flushRun - the first
+#	flush of the process starts the file, later ones (each watch job) append to it
+missingImages = []
+missingImagesLock = threading.Lock()
+missingImagesStarted = False
+
+def reportMissing(book, emblemId, kind, fleNme):
+	with missingImagesLock:
+		missingImages.append([book, emblemId, kind, fleNme])
 	
 # Look through the result from an API call that returned 200 to see if it is just an error message.
 # Returns 1 for an error and 0 for no error.
@@ -66,13 +367,392 @@ def checkForError(error_case,result,url):
 	else:
 		return result.content.find(error_case) == -1
 
-# getRequest Handles calls out to the three services we use, checks returned data to make sure it is present
+# Run metrics, collected only when METRICS_ENABLED. Stage times and counters are also added to the book being processed,
+#	the currentBook context variable - set by processBook and carried into the lookup and copy pools' threads
+currentBook = contextvars.ContextVar('currentBook', default=None)
+
+class Metrics:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.stages = {}
+		self.hosts = {}
+		self.counters = {}
+		self.books = {}
+
+	def book(self):
+		book = currentBook.get()
+		if book is None:
+			return None
+		if book not in self.books:
+			self.books[book] = {'stages' : {}, 'counters' : {}}
+		return self.books[book]
+
+	def stage(self, name, seconds):
+		with self.lock:
+			total = self.stages.setdefault(name, {'count' : 0, 'seconds' : 0.0, 'max' : 0.0})
+			total['count'] += 1
+			total['seconds'] += seconds
+			total['max'] = max(total['max'], seconds)
+			book = self.book()
+			if book is not None:
+				book['stages'][name] = book['stages'].get(name, 0.0) + seconds
+
+	def count(self, name, n):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+			book = self.book()
+			if book is not None:
+				book['counters'][name] = book['counters'].get(name, 0) + n
+
+	def latency(self, host, seconds):
+		with self.lock:
+			histogram = self.hosts.get(host)
+			if histogram is None:
+				histogram = {'count' : 0, 'seconds' : 0.0, 'buckets' : [0] * len(METRICS_BUCKETS)}
+				self.hosts[host] = histogram
+			histogram['count'] += 1
+			histogram['seconds'] += seconds
+			for i, bound in enumerate(METRICS_BUCKETS):
+				if seconds <= bound:
+					histogram['buckets'][i] += 1
+
+	def write(self, jsonFile, promFile):
+		with self.lock:
+			run = {'started' : datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'), 'seconds' : time.time() - self.started, 'stages' : self.stages, 'hosts' : {}, 'counters' : self.counters}
+			for host, histogram in self.hosts.items():
+				run['hosts'][host] = {'count' : histogram['count'], 'seconds' : histogram['seconds'], 'buckets' : dict(zip([str(bound) for bound in METRICS_BUCKETS], histogram['buckets']))}
+			with open(jsonFile + '.tmp', 'w') as fle:
+				json.dump({'run' : run, 'books' : self.books}, fle, indent=1)
+			os.replace(jsonFile + '.tmp', jsonFile)
+
+			lines = ['# HELP emblematica_run_seconds Wall time of the run', '# TYPE emblematica_run_seconds gauge', 'emblematica_run_seconds ' + repr(run['seconds'])]
+			lines += ['# HELP emblematica_stage_seconds_total Time spent in each stage', '# TYPE emblematica_stage_seconds_total counter']
+			lines += ['emblematica_stage_seconds_total{stage="%s"} %r' % (name, total['seconds']) for name, total in sorted(self.stages.items())]
+			lines += ['# HELP emblematica_stage_runs_total Times each stage ran', '# TYPE emblematica_stage_runs_total counter']
+			lines += ['emblematica_stage_runs_total{stage="%s"} %d' % (name, total['count']) for name, total in sorted(self.stages.items())]
+			lines += ['# HELP emblematica_request_seconds Latency of requests to each host', '# TYPE emblematica_request_seconds histogram']
+			for host, histogram in sorted(self.hosts.items()):
+				for bound, count in zip(METRICS_BUCKETS, histogram['buckets']):
+					lines.append('emblematica_request_seconds_bucket{host="%s",le="%s"} %d' % (host, bound, count))
+				lines.append('emblematica_request_seconds_bucket{host="%s",le="+Inf"} %d' % (host, histogram['count']))
+				lines.append('emblematica_request_seconds_sum{host="%s"} %r' % (host, histogram['seconds']))
+				lines.append('emblematica_request_seconds_count{host="%s"} %d' % (host, histogram['count']))
+			for name, value in sorted(self.counters.items()):
+				metric = 'emblematica_' + re.sub(r'([A-Z])', r'_\1', name).lower() + '_total'
+				lines += ['# TYPE ' + metric + ' counter', metric + ' ' + str(value)]
+			with open(promFile + '.tmp', 'w') as fle:
+				fle.write('\n'.join(lines) + '\n')
+			os.replace(promFile + '.tmp', promFile)
+
+metrics = None
+metricsLock = threading.Lock()
+
+def getMetrics():
+	global metrics
+	if metrics is None:
+		with metricsLock:
+			if metrics is None:
+				metrics = Metrics()
+	return metrics
+
+class StageTimer:
+	def __init__(self, stage):
+		self.stage = stage
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+
+	def __exit__(self, *exc):
+		getMetrics().stage(self.stage, time.perf_counter() - self.start)
+
+# time a block as a stage - with timed('stage'): ...
+def timed(stage):
+	if not METRICS_ENABLED:
+		return contextlib.nullcontext()
+	return StageTimer(stage)
+
+# time every call of a function as a stage
+def timedStage(stage):
+	def decorate(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not METRICS_ENABLED:
+				return func(*args, **kwargs)
+			with StageTimer(stage):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorate
+
+def countMetric(name, n=1):
+	if METRICS_ENABLED:
+		getMetrics().count(name, n)
+
+def observeLatency(url, seconds):
+	if METRICS_ENABLED:
+		getMetrics().latency(urllib.parse.urlsplit(url).hostname, seconds)
+
+# processBook runs a book inside bookMetrics, which names it for the metrics and times it as a whole
+@contextlib.contextmanager
+def bookMetrics(book):
+	token = currentBook.set(book)
+	try:
+		with timed('book'):
+			yield
+	finally:
+		currentBook.reset(token)
+
+# Per-book profiles (PROFILE_BOOKS) - (book, seconds, peak MB, kept) for the run ranking
+bookProfiles = []
+bookProfilesLock = threading.Lock()
+profileLock = threading.Lock()
+currentProfile = contextvars.ContextVar('currentProfile', default=None)
+
+class BookProfile:
+	def __init__(self, book):
+		self.book = book
+		self.profiler = cProfile.Profile()
+		self.start = tracemalloc.take_snapshot()
+		self.snapshot = None
+		self.snapshotSize = 0
+
+	# keep a snapshot of the traced allocations when there is more traced memory than at the book's earlier checkpoints -
+	#	by the time parseXML returns its trees are released, so the allocation sites are taken at its stage boundaries
+	#	(with the profiler paused, so the snapshots stay out of the book's profile)
+	def checkpoint(self):
+		self.profiler.disable()
+		size = tracemalloc.get_traced_memory()[0]
+		if size > self.snapshotSize:
+			self.snapshot = tracemalloc.take_snapshot()
+			self.snapshotSize = size
+		self.profiler.enable()
+
+	# the allocation sites that grew most between the start of the book and its highest checkpoint
+	def allocationSites(self):
+		if self.snapshot is None:
+			return []
+		ignored = (tracemalloc.Filter(False, tracemalloc.__file__),)
+		return self.snapshot.filter_traces(ignored).compare_to(self.start.filter_traces(ignored), 'traceback')[:PROFILE_TOP]
+
+def profileCheckpoint():
+	profile = currentProfile.get()
+	if profile is not None:
+		profile.checkpoint()
+
+# processSpine runs parseXML inside profiledBook - with PROFILE_BOOKS it is profiled and its time and memory peak ranked
+#	cProfile sees the book's own thread; emblem transforms in the pool and image copies show up as the waits for them
+@contextlib.contextmanager
+def profiledBook(book, fqDirNme):
+	if not PROFILE_BOOKS:
+		yield
+		return
+	with profileLock:
+		if not tracemalloc.is_tracing():
+			tracemalloc.start(PROFILE_FRAMES)
+		tracemalloc.reset_peak()
+		baseline = tracemalloc.get_traced_memory()[0]
+		profile = BookProfile(book)
+		token = currentProfile.set(profile)
+		start = time.perf_counter()
+		profile.profiler.enable()
+		try:
+			yield
+		finally:
+			profile.profiler.disable()
+			seconds = time.perf_counter() - start
+			currentProfile.reset(token)
+			peak = (tracemalloc.get_traced_memory()[1] - baseline) / (1024*1024)
+			kept = seconds > PROFILE_SECONDS or peak > PROFILE_MEMORY_MB
+			if kept:
+				writeProfile(profile, seconds, peak, fqDirNme)
+			with bookProfilesLock:
+				bookProfiles.append((book, seconds, peak, kept))
+
+def writeProfile(profile, seconds, peak, fqDirNme):
+	profileFile = fqDirNme + '\\supplementary\\' + profile.book + '_profile'
+	profile.profiler.dump_stats(profileFile + '.prof')
+	with open(profileFile + '.txt', 'w') as fle:
+		fle.write('%s - %.1f s, traced memory peak %.1f MB above the start of the book\n\n' % (profile.book, seconds, peak))
+		pstats.Stats(profile.profiler, stream=fle).sort_stats('cumulative').print_stats(PROFILE_TOP)
+		if profile.snapshot is not None:
+			fle.write('allocation sites at the highest checkpoint (%.1f MB traced), by growth since the start of the book\n' % (profile.snapshotSize / (1024*1024)))
+			for stat in profile.allocationSites():
+				fle.write('%+.1f KB in %+d blocks\n' % (stat.size_diff / 1024, stat.count_diff))
+				for line in stat.traceback.format():
+					fle.write(line + '\n')
+	print('profile kept in ' + profileFile + '.txt')
+
+# rank the profiled books of the run - slowest first, then heaviest first
+def writeProfileRanking(fleNme):
+	with bookProfilesLock:
+		profiles = list(bookProfiles)
+	with open(fleNme, 'w') as fle:
+		fle.write('%d books profiled, profiles kept for %d (over %s s or %s MB)\n' % (len(profiles), sum(1 for p in profiles if p[3]), PROFILE_SECONDS, PROFILE_MEMORY_MB))
+		for title, key in (('slowest', 1), ('heaviest', 2)):
+			fle.write('\n' + title + '\n')
+			for book, seconds, peak, kept in sorted(profiles, key=lambda p: p[key], reverse=True)[:PROFILE_TOP]:
+				fle.write('%10.1f s %10.1f MB  %s%s\n' % (seconds, peak, book, '  (profile kept)' if kept else ''))
+
+httpAdapter = None
+httpLock = threading.Lock()
+httpLocal = threading.local()
+
+# Session for the calling thread. requests sessions are not thread-safe, so each thread gets its own, but they all
+#	mount the same HTTPAdapter - its urllib3 pool manager is thread-safe and keeps the per-host keep-alive pools
+def httpSession():
+	global httpAdapter
+	session = getattr(httpLocal, 'session', None)
+	if session is None:
+		with httpLock:
+			if httpAdapter is None:
+				httpAdapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+		session = requests.Session()
+		session.mount('http://', httpAdapter)
+		session.mount('https://', httpAdapter)
+		session.headers['Accept-Encoding'] = 'gzip, deflate' if HTTP_COMPRESSION else 'identity'
+		httpLocal.session = session
+	return session
+
+# GET through the calling thread's pooled session, with HTTP_TIMEOUT unless a timeout is given
+def httpGet(url, **kwargs):
+	kwargs.setdefault('timeout', HTTP_TIMEOUT)
+	return httpSession().get(url, **kwargs)
+
+# Raised when a service stays unavailable - retries used up, or its circuit is open. The book being processed
+#	is not finished and is put on the retry list
+class ServiceUnavailable(Exception):
+	pass
+
+# Token bucket limiting the request rate to one service; take() blocks until a request may be sent
+class TokenBucket:
+	def __init__(self, rate, burst):
+		self.lock = threading.Lock()
+		self.rate = rate
+		self.capacity = burst
+		self.tokens = burst
+		self.stamp = time.monotonic()
+
+	def take(self):
+		if self.rate is None:
+			return
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now-self.stamp)*self.rate)
+				self.stamp = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1-self.tokens) / self.rate
+			time.sleep(wait)
+
+# Circuit breaker for one service. After failureThreshold consecutive failed requests the circuit opens and every
+#	request fails fast with ServiceUnavailable for cooldown seconds; then a single trial request is let through,
+#	closing the circuit again if it succeeds and reopening it if it fails. check() returns True for the trial request,
+#	whose caller ends it with endTrial() however the request finished
+class CircuitBreaker:
+	def __init__(self, host, failureThreshold, cooldown):
+		self.lock = threading.Lock()
+		self.host = host
+		self.failureThreshold = failureThreshold
+		self.cooldown = cooldown
+		self.failures = 0
+		self.openedAt = None
+		self.openFor = cooldown
+		self.trial = False
+
+	def check(self):
+		with self.lock:
+			if self.openedAt is None:
+				return
+			if self.trial or time.monotonic() - self.openedAt < self.openFor:
+				raise ServiceUnavailable(self.host + ' circuit open')
+			self.trial = True
+			return True
+
+	# a trial that ended without success() or failure() - an exception on the way - counts as a failed one
+	def endTrial(self):
+		with self.lock:
+			if not self.trial:
+				return
+			self.trial = False
+			self.openedAt = time.monotonic()
+			logging.warning(self.host + ' circuit opened for ' + str(self.openFor) + 's')
+
+	def success(self):
+		with self.lock:
+			self.failures = 0
+			self.openedAt = None
+			self.openFor = self.cooldown
+			self.trial = False
+
+	def failure(self):
+		with self.lock:
+			self.failures += 1
+			if self.trial or self.failures >= self.failureThreshold:
+				if self.openedAt is None or self.trial:
+					logging.warning(self.host + ' circuit opened for ' + str(self.openFor) + 's')
+				self.openedAt = time.monotonic()
+				self.trial = False
+
+	# open the circuit straight away, e.g. when the service asks us to stay away for longer than we are prepared to wait
+	def trip(self, seconds):
+		with self.lock:
+			self.openedAt = time.monotonic()
+			self.openFor = max(seconds, self.cooldown)
+			self.trial = False
+			logging.warning(self.host + ' circuit opened for ' + str(self.openFor) + 's')
+
+# retry settings, rate limit and circuit breaker for one service
+class HostPolicy:
+	def __init__(self, host, settings):
+		self.attempts = settings['attempts']
+		self.baseDelay = settings['baseDelay']
+		self.maxDelay = settings['maxDelay']
+		self.bucket = TokenBucket(settings['rate'], settings['burst'])
+		self.breaker = CircuitBreaker(host, settings['failureThreshold'], settings['cooldown'])
+
+	# full-jitter exponential backoff before retry number attempt (1 = first retry)
+	def backoff(self, attempt):
+		return random.uniform(0, min(self.maxDelay, self.baseDelay * 2**(attempt-1)))
+
+hostPolicies = dict((host, HostPolicy(host, settings)) for host, settings in RETRY_POLICY.items())
+hostPoliciesLock = threading.Lock()
+
+# HostPolicy for the service a url points at; hosts without an entry in RETRY_POLICY get their own default policy.
+#	The lookup holds the same lock as the insert, as another thread may be adding a host to the dict
+def hostPolicy(url):
+	with hostPoliciesLock:
+		for host, policy in hostPolicies.items():
+			if host in url:
+				return policy
+		host = urllib.parse.urlsplit(url).netloc
+		if host not in hostPolicies:
+			hostPolicies[host] = HostPolicy(host, DEFAULT_RETRY_POLICY)
+		return hostPolicies[host]
+
+# seconds asked for by a Retry-After header (either delay-seconds or an HTTP date), or None
+def retryAfter(result):
+	value = result.headers.get('Retry-After') if result is not None else None
+	if value is None:
+		return None
+	try:
+		return max(0, int(value))
+	except ValueError:
+		pass
+	try:
+		return max(0, (email.utils.parsedate_to_datetime(value) - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+	except (TypeError, ValueError):
+		return None
+
+# fetchRequest Handles calls out to the three services we use, checks returned data to make sure it is present
 #	and in the right format. If there is an error or timeout, this handles the error. If a response
 #	is 403 or 404, we give up. If we get a 200 response but it contains an error message about the
-#	service rather than the content we want, we retry. We keep retrying the query every 6 seconds to 
-#	avoid overwhelming the service until we get a proper response.
+#	service rather than the content we want, we retry. Retries follow the host's RETRY_POLICY: jittered exponential
+#	backoff (or the server's Retry-After), a token bucket rate limit and a capped number of attempts, after which -
+#	or straight away if the host's circuit is open - ServiceUnavailable is raised.
 # check for names / subjects in viaf.org  
-def getRequest(url,expectJSON):
+def fetchRequest(url,expectJSON):
 	local_start_time = datetime.datetime.now().time()
 
 	if 'viaf.org' in url:
@@ -93,132 +773,1012 @@ def getRequest(url,expectJSON):
 	else:
 		error_case = b'<title>Temporarily out of service</title>'
 
-	logging.debug(url)
-	try:
-		result = requests.get(url,timeout=60)
-		if expectJSON:
-			check_json = result.json()
-	except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError) as e:
+	policy = hostPolicy(url)
+	result = None
+	for attempt in range(1, policy.attempts+1):
+		trial = policy.breaker.check()
 		try:
-			if result:
-				logging.debug(result.status_code)
-		except:
-			result = BrokenResponse()
+			policy.bucket.take()
+			logging.debug(url)
+			countMetric('requests')
+			requestStart = time.perf_counter()
+			try:
+				result = httpGet(url)
+				if expectJSON:
+					check_json = result.json()
+			except (requests.exceptions.RequestException, ValueError) as e:
+				logging.debug(e)
+			observeLatency(url, time.perf_counter() - requestStart)
+
+			if result is not None and (result.status_code == 403 or result.status_code == 404):
+				policy.breaker.success()
+				local_end_time = datetime.datetime.now().time()
+				duration = datetime.datetime.combine(datetime.date.min,local_end_time)-datetime.datetime.combine(datetime.date.min,local_start_time)
+				logging.debug("Nada")
+				return None
+
+			if result is not None and result.status_code == 200 and checkForError(error_case,result,url):
+				policy.breaker.success()
+				logging.debug("Got result")
+				logging.debug(result.content)
+				local_end_time = datetime.datetime.now().time()
+				duration = datetime.datetime.combine(datetime.date.min,local_end_time)-datetime.datetime.combine(datetime.date.min,local_start_time)
+				return result
+
+			policy.breaker.failure()
+		finally:
+			if trial:
+				policy.breaker.endTrial()
+		if attempt == policy.attempts:
+			break
+		delay = policy.backoff(attempt)
+		serverDelay = retryAfter(result)
+		if serverDelay is not None:
+			if serverDelay > policy.maxDelay:
+				policy.breaker.trip(serverDelay)
+				raise ServiceUnavailable(url + ' - Retry-After ' + str(serverDelay) + 's')
+			delay = max(delay, serverDelay)
+		logging.debug("Retrying " + url + " in " + str(round(delay, 1)) + "s")
+		if result is not None:
+			logging.debug(result.status_code)
+		countMetric('retries')
+		time.sleep(delay)
+		result = None
+
+	raise ServiceUnavailable(url + ' - no usable answer after ' + str(policy.attempts) + ' attempts')
+
+# Stand-in for a requests response when the answer comes out of the authority cache
+#	callers only ever use status_code, content and json()
+class CachedResponse:
+	def __init__(self, url, status_code, content):
+		self.url = url
+		self.status_code = status_code
+		self.content = content
+
+	def json(self):
+		return json.loads(self.content.decode('utf-8'))
+
+# Persistent cache of authority lookups, keyed by the normalized query URL
+#	one SQLite connection is shared by all threads, guarded by a lock
+class AuthorityCache:
+	def __init__(self, fleNme):
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.negativeHits = 0
+		self.conn = sqlite3.connect(fleNme, check_same_thread=False)
+		self.conn.execute('CREATE TABLE IF NOT EXISTS lookups (key TEXT PRIMARY KEY, url TEXT, status INTEGER, content BLOB, negative INTEGER, fetched REAL, expires REAL)')
+		self.conn.commit()
+
+	# Returns (True, response) on a live hit - response is None for a cached 403/404 - and (False, None) on a miss
+	def get(self, url):
+		key = normalizeQueryUrl(url)
+		with self.lock:
+			row = self.conn.execute('SELECT status, content, negative, expires FROM lookups WHERE key = ?', (key,)).fetchone()
+			if row is None or row[3] < time.time():
+				self.misses += 1
+				return False, None
+			self.hits += 1
+			if row[2]:
+				self.negativeHits += 1
+		if row[0] == 403 or row[0] == 404:
+			return True, None
+		return True, CachedResponse(url, row[0], row[1])
+
+	def put(self, url, result):
+		key = normalizeQueryUrl(url)
+		if result is None:
+			status, content, negative = 404, b'', 1
+		else:
+			status, content = result.status_code, result.content
+			negative = 1 if isNoMatch(url, content) else 0
+		ttl = CACHE_NEGATIVE_TTL if negative else cacheTtl(url)
+		now = time.time()
+		with self.lock:
+			self.conn.execute('INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?, ?, ?)', (key, url, status, content, negative, now, now+ttl))
+			self.conn.commit()
+
+	def report(self):
+		total = self.hits + self.misses
+		rate = (100.0 * self.hits / total) if total > 0 else 0.0
+		return 'authority cache: %d hits (%d negative), %d misses, %.1f%% hit rate' % (self.hits, self.negativeHits, self.misses, rate)
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
+
+# Normalize a query URL for use as a cache key - undo percent / html escaping, fold case and collapse whitespace
+def normalizeQueryUrl(url):
+	key = html.unescape(urllib.parse.unquote(url))
+	return ' '.join(key.split()).lower()
+
+# TTL for a query URL, taken from the first matching authority in CACHE_TTL
+def cacheTtl(url):
+	for authority, ttl in CACHE_TTL.items():
+		if authority in url:
+			return ttl
+	return CACHE_DEFAULT_TTL
+
+# True if a 200 answer says the term was not found: VIAF result of null, or an id.loc.gov results table with no rows
+def isNoMatch(url, content):
+	if 'viaf.org' in url:
+		try:
+			return json.loads(content.decode('utf-8'))['result'] is None
+		except (ValueError, KeyError, TypeError):
+			return False
+	try:
+		return len(XP_LC_ROWS(ET.HTML(content))) == 0
+	except (ET.ParserError, ValueError):
+		return False
+
+authorityCache = None
+authorityCacheLock = threading.Lock()
+
+# Index of authority labels built by importAuthorities - one row per label of each record, with the scheme the
+#	record belongs to ('/authorities/subjects', '/vocabulary/relators', ... or 'viaf'), its id.loc.gov path or viafid,
+#	and for VIAF clusters the AutoSuggest nametype
+class LocalAuthorityIndex:
+	def __init__(self, fleNme):
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(fleNme, check_same_thread=False)
+		self.conn.execute('CREATE TABLE IF NOT EXISTS labels (scheme TEXT, key TEXT, uri TEXT, label TEXT, nametype TEXT)')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS labelsByKey ON labels (scheme, key)')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS imports (scheme TEXT, source TEXT, records INTEGER, imported TEXT)')
+		# full text index of the label keys for phrase searches - built for an index imported before it existed
+		indexed = self.conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'labelWords'").fetchone()[0] > 0
+		self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS labelWords USING fts5(key, content='labels', content_rowid='rowid')")
+		if not indexed:
+			self.rebuild()
+		self.conn.commit()
+
+	def rebuild(self):
+		self.conn.execute("INSERT INTO labelWords(labelWords) VALUES('rebuild')")
+
+	# records whose label matches, in import order and one per record
+	def find(self, scheme, label):
+		with self.lock:
+			rows = self.conn.execute('SELECT uri, label, nametype FROM labels WHERE scheme = ? AND key = ? ORDER BY rowid', (scheme, authorityKey(label))).fetchall()
+		found = []
+		seen = set()
+		for row in rows:
+			if row[0] not in seen:
+				seen.add(row[0])
+				found.append(row)
+		return found
+
+	# True when the index holds another label the service's search for label would also list - for id.loc.gov one
+	#	holding the label's words as a phrase, as q=aLabel:"..." matches them, for VIAF one starting with it, as
+	#	AutoSuggest completes it. Only used to send such searches on to the service, never to answer them
+	def extended(self, scheme, label):
+		key = authorityKey(label)
+		with self.lock:
+			if scheme == 'viaf':
+				row = self.conn.execute('SELECT 1 FROM labels WHERE scheme = ? AND key > ? AND key < ? LIMIT 1', (scheme, key, key + '\uffff')).fetchone()
+			else:
+				row = self.conn.execute('SELECT 1 FROM labelWords JOIN labels ON labels.rowid = labelWords.rowid WHERE labelWords MATCH ? AND labels.scheme = ? AND labels.key != ? LIMIT 1', ('"' + key.replace('"', '""') + '"', scheme, key)).fetchone()
+		return row is not None
+
+	def close(self):
+		self.conn.close()
+
+# the form labels are indexed and looked up by - the same lower case, '.' to space and strip the enrichment applies
+#	to spine terms, plus NFC and single spaces so differently encoded copies of a label meet
+def authorityKey(label):
+	return ' '.join(normalize('NFC', label).lower().replace('.', ' ').split())
+
+# The matching key of a personal or corporate name - authorityKey of its compatibility form (NFKC, so long s and
+#	ligatures become plain letters) with diacritics and combining marks removed, brackets, quotes and ?/! dropped,
+#	commas and semicolons followed by one space, dashes as '-' with no spaces around them. A trailing parenthesized
+#	group becomes a comma group, and when everything after the last comma is a date it is written one way: AACR2
+#	qualifiers in their RDA form (ca. - approximately, fl. - active, b. 1500 - 1500-, d. 1622 - -1622), no full stop.
+#	So "Alciato, Andrea, 1492–1550." and "alciato,andrea (1492 - 1550)" meet; a group that is not a whole date is left alone
+NAME_PUNCTUATION = re.compile(r'[()\[\]{}"\'?!\u2018\u2019\u201c\u201d]')
+NAME_DASHES = re.compile(r'\s*[-\u2010\u2011\u2012\u2013\u2014\u2015]+\s*')
+NAME_SEPARATORS = re.compile(r'\s*([,;:])\s*')
+NAME_PARENTHESIZED = re.compile(r'\s*\(([^()]*)\)[\s.]*$')
+NAME_DATE_WORDS = {'ca' : 'approximately', 'circa' : 'approximately', 'approx' : 'approximately', 'fl' : 'active', 'flourished' : 'active', 'born' : 'b', 'died' : 'd'}
+NAME_DATE = r'(?:(?:approximately|active) )?(?:\d{1,4}(?: bc)?|\d{1,2}(?:st|nd|rd|th) century)'
+NAME_BC = re.compile(r'(?<=\d) b c\b')
+NAME_DATES = re.compile('(?:[bd] )?' + NAME_DATE + '|' + NAME_DATE + '-(?:' + NAME_DATE + ')?|-' + NAME_DATE)
+
+def nameKey(name):
+	"""Spellings that share a key, and date groups that are not a whole date and are left as they are
+	(python -m doctest end2end-rev5Dec2019.py):
+
+	>>> nameKey('Alciato, Andrea, 1492\u20131550.')
+	'alciato, andrea, 1492-1550'
+	>>> nameKey('alciato,andrea (1492 - 1550)')
+	'alciato, andrea, 1492-1550'
+	>>> nameKey('Ripa, Cesare, approximately 1560-approximately 1622')
+	'ripa, cesare, approximately 1560-approximately 1622'
+	>>> nameKey('Ripa, Cesare, ca. 1560-ca. 1622')
+	'ripa, cesare, approximately 1560-approximately 1622'
+	>>> nameKey('Whitney, Geffrey, fl. 1586')
+	'whitney, geffrey, active 1586'
+	>>> nameKey('Vaenius, Otto, d. 1629')
+	'vaenius, otto, -1629'
+	>>> nameKey('Homer, b. 750 B.C.')
+	'homer, 750 bc-'
+	>>> nameKey('Ripa, Cesare, 1560-after 1622')
+	'ripa, cesare, 1560-after 1622'
+	>>> nameKey('Charles V, Holy Roman Emperor, 1500 1558')
+	'charles v, holy roman emperor, 1500 1558'
+	"""
+	name = ''.join(c for c in normalize('NFKD', normalize('NFKC', name)) if not combining(c))
+	name = NAME_PARENTHESIZED.sub(r', \1', name)
+	name = NAME_PUNCTUATION.sub(' ', name)
+	name = NAME_DASHES.sub('-', name)
+	name = NAME_SEPARATORS.sub(lambda m: m.group(1) + ' ', authorityKey(name).casefold()).strip(' ,;:')
+	heading, comma, dates = name.rpartition(', ')
+	if comma:
+		dates = re.sub(r'[a-z]+', lambda m: NAME_DATE_WORDS.get(m.group(0), m.group(0)), NAME_BC.sub(' bc', dates))
+		if NAME_DATES.fullmatch(dates):
+			if dates.startswith('b '):
+				dates = dates[2:] + '-'
+			elif dates.startswith('d '):
+				dates = '-' + dates[2:]
+			name = heading + ', ' + dates
+	return name
 
-	if result.status_code == 403 or result.status_code == 404:
-		local_end_time = datetime.datetime.now().time()
-		duration = datetime.datetime.combine(datetime.date.min,local_end_time)-datetime.datetime.combine(datetime.date.min,local_start_time)
-		logging.debug("Nada")
+# search url prefix -> the scheme it searches, as the local index and the suggest2 service name it
+LOCAL_AUTHORITY_SCHEMES = {
+BASE_VIAF_URL : 'viaf',
+BASE_LC_Relators : '/vocabulary/relators',
+BASE_LC_Countries : '/vocabulary/countries',
+BASE_LC_Subjects : '/authorities/subjects',
+BASE_LC_MARCGAC : '/vocabulary/geographicAreas',
+BASE_LC_NmeSubjects : '/authorities/names',
+BASE_LC_genreSubjects : '/authorities/genreForms'
+}
+
+localAuthorityIndex = None
+localAuthorityIndexLock = threading.Lock()
+
+def getLocalAuthorityIndex():
+	global localAuthorityIndex
+	if LOCAL_AUTHORITY_INDEX is None or not os.path.isfile(LOCAL_AUTHORITY_INDEX):
 		return None
+	if localAuthorityIndex is None:
+		with localAuthorityIndexLock:
+			if localAuthorityIndex is None:
+				localAuthorityIndex = LocalAuthorityIndex(LOCAL_AUTHORITY_INDEX)
+	return localAuthorityIndex
+
+# Answer an authority search from the local index, as the page or json the service would have returned, so that the
+#	enrichment applies its usual single-result rules. Returns (True, response) when answered, (False, None) otherwise
+def localAuthorityLookup(url):
+	index = getLocalAuthorityIndex()
+	if index is None:
+		return False, None
+	search = authoritySearch(url)
+	if search is None:
+		return False, None
+	scheme, label = search
+	found = index.find(scheme, label)
+	if LOCAL_AUTHORITY_MODE != 'only' and (len(found) != 1 or index.extended(scheme, label)):
+		return False, None
+
+	if scheme == 'viaf':
+		result = [{'term' : rowLabel, 'displayForm' : rowLabel, 'nametype' : nametype, 'viafid' : uri} for uri, rowLabel, nametype in found]
+		content = json.dumps({'query' : label, 'result' : result if len(result) > 0 else None}).encode('utf-8')
+	else:
+		content = lcSearchPage([(uri, rowLabel) for uri, rowLabel, nametype in found])
+	return True, CachedResponse(url, 200, content)
+
+# (scheme, label) searched for by an authority search url, None for other urls
+def authoritySearch(url):
+	for base, scheme in LOCAL_AUTHORITY_SCHEMES.items():
+		if url.startswith(base):
+			label = url[len(base):]
+			if scheme == 'viaf':
+				return scheme, label
+			if label.startswith('%22') and label.endswith('%22'):
+				return scheme, label[3:-3]
+			return None
+	return None
+
+# an id.loc.gov search results page listing the given (path, label) records, one result group each -
+#	what XP_LC_ROWS / XP_LC_GROUPS / XP_LC_RECORD_HREF read on the real page
+def lcSearchPage(records):
+	rows = ''.join('<tbody class="tbody-group"><tr><td><a title="Click to view record" href="%s">%s</a></td></tr></tbody>' % (html.escape(path), html.escape(label)) for path, label in records)
+	return ('<html><body><table class="id-std"><thead></thead>' + rows + '</table></body></html>').encode('utf-8')
 
-	logging.debug(url)
-	logging.debug(result.content)
+# Answer an id.loc.gov label search from the suggest2 json service, only where its hits prove what the phrase search
+#	page would list. A keyword search returns every label holding the searched words, a superset of the labels the
+#	phrase search matches, so when that list is complete (fewer hits than asked for) and every hit is one record whose
+#	authoritative label is the searched term (compared as authorityKey forms), the page would list just that record.
+#	It is returned as a search page linking /<scheme>/<id>.html, so valueURIs come out as from the scraped page.
+#	Returns (False, None) - and the caller scrapes the search page - for anything else: no json answer, no hits, a full
+#	page of hits, any hit with another label, or several records, whose order on the page suggest2 cannot tell
+def fetchLcSuggest(url):
+	search = authoritySearch(url)
+	if search is None or search[0] == 'viaf':
+		return False, None
+	scheme, label = search
+	suggestUrl = 'http://id.loc.gov' + scheme + '/suggest2?q=' + urllib.parse.quote(label) + '&searchtype=keyword&count=' + str(LC_SUGGEST_COUNT)
+	result = fetchRequest(suggestUrl, True)
+	if result is None:
+		return False, None
 	try:
-		if result.status_code == 200 and checkForError(error_case,result,url):
-			retry = False
-		else:
-			retry = True
-	except:
-		retry = True
+		hits = result.json()['hits']
+		key = authorityKey(label)
+		records = []
+		for hit in hits:
+			if authorityKey(hit['aLabel']) != key:
+				return False, None
+			path = urllib.parse.urlsplit(hit['uri']).path + '.html'
+			if path not in [p for p, l in records]:
+				records.append((path, hit['aLabel']))
+	except (ValueError, KeyError, TypeError) as e:
+		logging.debug('No json answer for ' + url + ' (' + str(e) + ')')
+		return False, None
+	if len(records) != 1 or len(hits) >= LC_SUGGEST_COUNT:
+		return False, None
+	return True, CachedResponse(url, 200, lcSearchPage(records))
+
+# fetch an authority search from its service - id.loc.gov searches through suggest2 when LC_BACKEND is 'json'
+def fetchAuthority(url, expectJSON):
+	if LC_BACKEND == 'json':
+		answered, result = fetchLcSuggest(url)
+		if answered:
+			return result
+	return fetchRequest(url, expectJSON)
 
-	logging.debug("Retrying")
+# Process-wide memo of name searches, keyed on (scheme, nameKey) - shared by the VIAF lookups of the book's names
+#	and the id.loc.gov lookups of its name subjects. The first search for a key is made and every other search for it,
+#	from any book and in whatever spelling, gets its answer; one made while the first is still in flight waits for it.
+#	Answers expire like the authority cache's (cacheTtl, CACHE_NEGATIVE_TTL for no match) and flushRun clears the memo,
+#	so a long-running watch or jobs worker starts every run or job afresh
+class NameMemo:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.answers = {}
 
-	while retry:
-		logging.debug("Retrying " + url)
-		logging.debug(result.status_code)
-		time.sleep(6)
+	def lookup(self, key, url, resolve):
+		with self.lock:
+			answer, expires = self.answers.get(key, (None, None))
+			first = answer is None or (expires is not None and expires <= time.time())
+			if first:
+				answer = concurrent.futures.Future()
+				self.answers[key] = (answer, None)
+		if not first:
+			countMetric('nameMemoHits')
+			return answer.result()[0], 'memo'
 		try:
-			result = requests.get(url,timeout=60)
-			if expectJSON:
-				check_json = result.json()
-		except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError) as e:
+			result = resolve()
+		except BaseException as e:
+			# not remembered - the next search for the name tries again
+			with self.lock:
+				if self.answers.get(key, (None,))[0] is answer:
+					del self.answers[key]
+			answer.set_exception(e)
+			raise
+		response = result[0]
+		negative = response is None or response.status_code != 200 or isNoMatch(url, response.content)
+		with self.lock:
+			if self.answers.get(key, (None,))[0] is answer:
+				self.answers[key] = (answer, time.time() + (CACHE_NEGATIVE_TTL if negative else cacheTtl(url)))
+		answer.set_result(result)
+		return result
+
+	# forget every answer; searches still in flight finish for the books waiting on them
+	def clear(self):
+		with self.lock:
+			self.answers = {}
+
+nameMemo = NameMemo()
+NAME_SCHEMES = ('viaf', '/authorities/names')
+
+# getRequest sits in front of fetchAuthority and answers from the name memo, the local authority index or the
+#	authority cache when it can, only going out to the service on a miss or expired entry
+def getRequest(url,expectJSON):
+	return lookupRequest(url, expectJSON)[0]
+
+# getRequest, also returning where the answer came from - 'memo', 'local', 'cache' or 'service'
+def lookupRequest(url,expectJSON):
+	if NAME_MEMO:
+		search = authoritySearch(url)
+		if search is not None and search[0] in NAME_SCHEMES:
+			return nameMemo.lookup((search[0], nameKey(search[1])), url, lambda: resolveRequest(url, expectJSON))
+	return resolveRequest(url, expectJSON)
+
+def resolveRequest(url,expectJSON):
+	global authorityCache
+	answered, result = localAuthorityLookup(url)
+	if answered:
+		countMetric('localIndexHits')
+		return result, 'local'
+	if not CACHE_ENABLED:
+		with hostSlot(url):
+			return fetchAuthority(url,expectJSON), 'service'
+	if authorityCache is None:
+		with authorityCacheLock:
+			if authorityCache is None:
+				authorityCache = AuthorityCache(CACHE_FILE)
+	hit, result = authorityCache.get(url)
+	if hit:
+		countMetric('cacheHits')
+		return result, 'cache'
+	countMetric('cacheMisses')
+	with hostSlot(url):
+		result = fetchAuthority(url,expectJSON)
+	authorityCache.put(url, result)
+	return result, 'service'
+
+hostSemaphores = dict((host, threading.BoundedSemaphore(limit)) for host, limit in HOST_LIMITS.items())
+
+# Semaphore limiting concurrent requests to the service a url points at (no limit for other hosts)
+def hostSlot(url):
+	for host, semaphore in hostSemaphores.items():
+		if host in url:
+			return semaphore
+	return contextlib.nullcontext()
+
+# lower-cased, de-punctuated text of a term element, as used to build every id.loc.gov query
+def termText(el):
+	return el.text.lower().replace(".", " ").strip()
+
+# Go through the book's nodes the same way the enrichment in parseXML does and collect every authority query it is going to make,
+#	without duplicates and in first-seen order. Terms that already carry a valueURI or are answered from the
+#	local mappings are left out. Returns a list of (url, expectJSON)
+def collectAuthorityQueries(nodes):
+	queries = {}
+	for sub in nodes.subjects:
+		if 1 <= len(sub) <= 5:
+			subText = '--'.join(termText(s) for s in sub[:3]) + ''.join(termText(s) for s in sub[3:])
+			queries[BASE_LC_Subjects + '%22'+subText+'%22'] = False
+		if len(sub) > 1:
+			subjectTerm = XP_TOPIC(sub)
+			for sT in subjectTerm:
+				if sT.get('valueURI') is None:
+					subjectText = termText(sT)
+					if subjectText not in subjects.keys() and "http://id.loc.gov/authorities/subject/"+subjectText not in subjects.values():
+						queries[BASE_LC_Subjects + '%22'+subjectText+'%22'] = False
+			if len(subjectTerm) > 0 :
+				for gA in XP_GEOGRAPHIC(sub):
+					if gA.get('valueURI') is None:
+						geoText = termText(gA)
+						if geoText not in geoAreas.keys() and "http://id.loc.gov/vocabulary/geographicAreas/"+geoText not in geoAreas.values():
+							queries[BASE_LC_MARCGAC + '%22'+geoText+'%22'] = False
+			for genre in XP_GENRE(sub):
+				if genre.get('valueURI') is None:
+					genreText = termText(genre)
+					if genreText not in genreSubjects.keys():
+						queries[BASE_LC_genreSubjects + '%22'+genreText+'%22'] = False
+		for nme in XP_NAME(sub):
+			if nme.get('valueURI') is None:
+				nmeParts = XP_NAMEPART(nme)
+				if len(nmeParts) == 3:
+					nmeText = termText(nmeParts[1]) + ', ' + termText(nmeParts[0]) + ', ' + termText(nmeParts[2])
+				elif len(nmeParts) == 2:
+					nmeText = termText(nmeParts[0]) + ', ' + termText(nmeParts[1])
+				elif len(nmeParts) == 1:
+					nmeText = termText(nmeParts[0])
+				else:
+					continue
+				if nmeText not in nmeSubjects.keys():
+					queries[BASE_LC_NmeSubjects + '%22'+nmeText+'%22'] = False
+	for nme in nodes.names:
+		if nme.get('valueURI') is None :
+			nmeParts = XP_NAMEPART(nme)
+			df = XP_DISPLAYFORM(nme)
+			if len(df) == 1:
+				nmePart = df[0].text
+			elif len(nmeParts) == 2:
+				nmePart = nmeParts[0].text+', '+nmeParts[1].text
+			elif len(nmeParts) == 1:
+				nmePart = nmeParts[0].text
+			else :
+				nmePart = None
+			if nmePart is not None:
+				queries[BASE_VIAF_URL + nmePart.replace("(", "").replace(")", "")] = True
+		for rT in nodes.roleTerms[nme]:
+			if rT.get('valueURI') is None:
+				roleText = termText(rT)
+				if roleText not in relators.keys() and "http://id.loc.gov/vocabulary/relators/"+roleText not in relators.values():
+					queries[BASE_LC_Relators + '%22'+roleText+'%22'] = False
+	return list(queries.items())
+
+# a book's resolved lookups - url -> response, with url -> (seconds, source) of each lookup in lookups
+class ResolvedQueries(dict):
+	def __init__(self):
+		dict.__init__(self)
+		self.lookups = {}
+
+# time a lookupRequest; returns (response, seconds, source)
+def timedLookup(url, expectJSON):
+	start = time.perf_counter()
+	result, source = lookupRequest(url, expectJSON)
+	return result, time.perf_counter() - start, source
+
+# Resolve a list of (url, expectJSON) queries concurrently through getRequest
+#	returns a ResolvedQueries; queries that raised are left out and will be retried inline by lookupResolved
+@timedStage('authorityLookups')
+def resolveQueries(queries, workers=None):
+	resolved = ResolvedQueries()
+	if len(queries) == 0:
+		return resolved
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers or RESOLVE_WORKERS) as pool:
+		futures = {pool.submit(contextvars.copy_context().run, timedLookup, url, expectJSON) : url for url, expectJSON in queries}
+		for future in concurrent.futures.as_completed(futures):
 			try:
-				if result:
-					logging.debug(result.status_code)
-			except:
-				result = BrokenResponse()
+				result, seconds, source = future.result()
+				resolved[futures[future]] = result
+				resolved.lookups[futures[future]] = (seconds, source)
+			except ServiceUnavailable as e:
+				logging.warning('Lookup failed: ' + str(e))
+			except Exception:
+				logging.exception('Lookup failed: ' + futures[future])
+	return resolved
+
+# answer a query from the book's pre-resolved lookups, falling back to a direct getRequest
+def lookupResolved(resolved, url, expectJSON):
+	if url in resolved:
+		return resolved[url]
+	result, seconds, source = timedLookup(url, expectJSON)
+	resolved.lookups[url] = (seconds, source)
+	return result
+
+# Buffers enrichment results and writes them in batches of RESULTS_BATCH_SIZE - a full buffer is written by the thread
+#	that filled it, outside the buffer lock, so books keep recording while a batch goes out. Subclasses provide writeBatch.
+#	The results are diagnostics: a batch that cannot be written is logged and dropped, never failing the book
+class ResultsSink:
+	COLUMNS = ('run', 'book', 'termType', 'term', 'matchCount', 'valueURI', 'latency', 'cacheHit', 'recorded')
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.rows = []
+		self.run = datetime.datetime.now().isoformat(timespec='seconds')
+		self.written = 0
+		self.dropped = 0
+
+	def add(self, book, termType, term, matchCount, valueURI, latency, cacheHit):
+		with self.lock:
+			self.rows.append((self.run, book, termType, term, matchCount, valueURI, latency, cacheHit, time.time()))
+			if len(self.rows) < RESULTS_BATCH_SIZE:
+				return
+			rows = self.rows
+			self.rows = []
+		self.write(rows)
 
+	def write(self, rows):
+		if len(rows) == 0:
+			return
 		try:
-			if result.status_code == 200 and checkForError(error_case,result,url):
-				retry = False
-		except:
+			self.writeBatch(rows)
+		except Exception:
+			logging.exception('Enrichment results not recorded, ' + str(len(rows)) + ' rows dropped')
+			countMetric('resultsDropped', len(rows))
+			with self.lock:
+				self.dropped += len(rows)
+			return
+		with self.lock:
+			self.written += len(rows)
+
+	def flush(self):
+		with self.lock:
+			rows = self.rows
+			self.rows = []
+		self.write(rows)
+
+	def close(self):
+		self.flush()
+
+class SQLiteResultsSink(ResultsSink):
+	def __init__(self, fleNme):
+		ResultsSink.__init__(self)
+		self.connLock = threading.Lock()
+		self.conn = sqlite3.connect(fleNme, check_same_thread=False)
+		self.conn.execute('CREATE TABLE IF NOT EXISTS enrichmentResults (run TEXT, book TEXT, termType TEXT, term TEXT, matchCount INTEGER, valueURI TEXT, latency REAL, cacheHit INTEGER, recorded REAL)')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS enrichmentResultsByTerm ON enrichmentResults (termType, term)')
+		self.conn.commit()
+
+	def writeBatch(self, rows):
+		with self.connLock:
+			self.conn.executemany('INSERT INTO enrichmentResults VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+			self.conn.commit()
+
+	def close(self):
+		ResultsSink.close(self)
+		self.conn.close()
+
+# MySQL sink - each batch is written on a connection borrowed from the pool, so books flushing at the same time
+#	do not queue behind one connection. The pool raises at once when it has no free connection, so the borrowers are
+#	counted by a semaphore of the pool's size and one more waits for a connection to come back
+class MySQLResultsSink(ResultsSink):
+	def __init__(self, config):
+		ResultsSink.__init__(self)
+		self.pool = MySQLConnectionPool(pool_name='emblematicaResults', pool_size=RESULTS_MYSQL_POOL_SIZE, **config)
+		self.connections = threading.BoundedSemaphore(RESULTS_MYSQL_POOL_SIZE)
+		conn = self.pool.get_connection()
+		try:
+			cursor = conn.cursor()
+			cursor.execute('CREATE TABLE IF NOT EXISTS enrichmentResults (run VARCHAR(32), book VARCHAR(255), termType VARCHAR(16), term TEXT, matchCount INT, valueURI VARCHAR(512), latency DOUBLE, cacheHit TINYINT, recorded DOUBLE, '
+				'INDEX enrichmentResultsByTerm (termType, term(191)), INDEX enrichmentResultsByBook (book)) CHARACTER SET utf8mb4')
+			conn.commit()
+			cursor.close()
+		finally:
+			conn.close()
+
+	def writeBatch(self, rows):
+		with self.connections:
+			conn = self.pool.get_connection()
+			try:
+				cursor = conn.cursor()
+				cursor.executemany('INSERT INTO enrichmentResults VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)', rows)
+				conn.commit()
+				cursor.close()
+			finally:
+				conn.close()
+
+# one csv file for the whole run, appended to batch by batch
+class CsvResultsSink(ResultsSink):
+	def __init__(self, fleNme):
+		ResultsSink.__init__(self)
+		self.fileLock = threading.Lock()
+		newFile = not os.path.isfile(fleNme)
+		self.fle = open(fleNme, 'a', newline='', encoding='utf-8')
+		self.writer = csv.writer(self.fle)
+		if newFile:
+			self.writer.writerow(self.COLUMNS)
+
+	def writeBatch(self, rows):
+		with self.fileLock:
+			self.writer.writerows(rows)
+			self.fle.flush()
+
+	def close(self):
+		ResultsSink.close(self)
+		self.fle.close()
+
+resultsSink = None
+resultsSinkLock = threading.Lock()
+
+def getResultsSink():
+	global resultsSink
+	if RESULTS_SINK is None:
+		return None
+	if resultsSink is None:
+		with resultsSinkLock:
+			if resultsSink is None:
+				if RESULTS_SINK == 'mysql':
+					resultsSink = MySQLResultsSink(RESULTS_MYSQL)
+				elif RESULTS_SINK == 'csv':
+					resultsSink = CsvResultsSink(RESULTS_FILE)
+				else:
+					resultsSink = SQLiteResultsSink(RESULTS_FILE)
+	return resultsSink
+
+# Record the outcome of one enriched term with the lookup that answered it (url None when a local mapping did)
+def recordResult(resolved, book, termType, term, matchCount, valueURI, url=None):
+	sink = getResultsSink()
+	if sink is None:
+		return
+	latency, source = resolved.lookups.get(url, (None, None))
+	cacheHit = None if source is None else int(source != 'service')
+	sink.add(book, termType, term, matchCount, valueURI, latency, cacheHit)
+
+# The nodes parseXML works on, gathered in one walk of the tree instead of a // XPath scan each. Lists are in
+#	document order and match what the XPath noted against each would return on the tree (whose root is the walk root)
+class BookNodes:
+	def __init__(self, root):
+		self.biblioDescs = []		# //e:biblioDesc
+		self.mods = []				# //m:mods
+		self.languages = []			# //m:mods/m:language
+		self.places = []			# //m:mods/m:originInfo/m:place
+		self.subjects = []			# //m:mods/m:subject[@authority="lcsh"]
+		self.names = []				# //m:mods/m:name
+		self.roleTerms = {}			# name -> name/m:role/m:roleTerm, for each of names
+		self.datesIssued = []		# //m:mods/m:originInfo/m:dateIssued
+		self.emblems = []			# //e:emblem
+		self.picturas = []			# //e:emblem/e:pictura[@x:href]
+		for el in root.iter(E_NS+'biblioDesc', M_NS+'mods', M_NS+'language', M_NS+'place', M_NS+'subject', M_NS+'name', M_NS+'roleTerm', M_NS+'dateIssued', E_NS+'emblem', E_NS+'pictura'):
+			tag = el.tag
+			parent = el.getparent() if el is not root else None
+			parentTag = parent.tag if parent is not None else None
+			if tag == E_NS+'biblioDesc':
+				self.biblioDescs.append(el)
+			elif tag == M_NS+'mods':
+				self.mods.append(el)
+			elif tag == E_NS+'emblem':
+				self.emblems.append(el)
+			elif tag == E_NS+'pictura':
+				if parentTag == E_NS+'emblem' and el.get(XLINK_HREF) is not None:
+					self.picturas.append(el)
+			elif tag == M_NS+'language':
+				if parentTag == M_NS+'mods':
+					self.languages.append(el)
+			elif tag == M_NS+'subject':
+				if parentTag == M_NS+'mods' and el.get('authority') == 'lcsh':
+					self.subjects.append(el)
+			elif tag == M_NS+'name':
+				if parentTag == M_NS+'mods':
+					self.names.append(el)
+					self.roleTerms[el] = []
+			elif tag == M_NS+'place' or tag == M_NS+'dateIssued':
+				if parentTag == M_NS+'originInfo' and parent is not root and parent.getparent() is not None and parent.getparent().tag == M_NS+'mods':
+					if tag == M_NS+'place':
+						self.places.append(el)
+					else:
+						self.datesIssued.append(el)
+			elif tag == M_NS+'roleTerm':
+				if parentTag == M_NS+'role' and parent is not root:
+					nme = parent.getparent()
+					if nme in self.roleTerms:
+						self.roleTerms[nme].append(el)
+
+	# //e:emblem[@x:href]
+	def emblemsWithHref(self):
+		return [emblem for emblem in self.emblems if emblem.get(XLINK_HREF) is not None]
+
+	# //m:mods/m:originInfo/m:dateIssued[@encoding='marc' or @encoding='iso8601']
+	def codedDatesIssued(self):
+		return [dI for dI in self.datesIssued if dI.get('encoding') == 'marc' or dI.get('encoding') == 'iso8601']
+
+# update [full resolution] emblem href URL (pointing to images stored on UIUC emblemImages server) consistent with planned relocation
+def relocateEmblemHref(emblem):
+	aValue = emblem.attrib['{http://www.w3.org/1999/xlink}href'].replace(".grainger.", ".library.").replace("JP2Processed", "preservation")
+	emblem.attrib['{http://www.w3.org/1999/xlink}href'] = aValue
+
+# Copy engine shared by every book - copyImage runs on the copyPool threads and adds to copyTotals
+copyPool = None
+copyPoolLock = threading.Lock()
+copyTotals = {'copied' : 0, 'copiedBytes' : 0, 'linked' : 0, 'linkedBytes' : 0, 'skipped' : 0, 'skippedBytes' : 0}
+copyTotalsLock = threading.Lock()
+
+def getCopyPool():
+	global copyPool
+	if copyPool is None:
+		with copyPoolLock:
+			if copyPool is None:
+				copyPool = concurrent.futures.ThreadPoolExecutor(max_workers=COPY_WORKERS)
+	return copyPool
+
+def countCopy(kind, size):
+	with copyTotalsLock:
+		copyTotals[kind] += 1
+		copyTotals[kind+'Bytes'] += size
+	countMetric(kind)
+	countMetric(kind+'Bytes', size)
+
+# clone source to destination with the FICLONE ioctl (Linux btrfs / xfs); raises OSError where that is not available
+def reflink(source, destination):
+	if fcntl is None:
+		raise OSError('reflink is not supported on this platform')
+	with open(source, 'rb') as src, open(destination, 'wb') as dst:
+		fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())
+	shutil.copystat(source, destination)
+
+# copy source to destination in a single pass, hashing the bytes on their way through - returns (sha256, md5)
+#	the copy is written next to the destination and renamed over it, so a hard linked destination never writes through to its source
+def hashedCopy(source, destination):
+	sha256 = hashlib.sha256()
+	md5 = hashlib.md5()
+	try:
+		with open(source, 'rb') as src, open(destination + '.tmp', 'wb') as dst:
+			while True:
+				chunk = src.read(COPY_BUFFER)
+				if not chunk:
+					break
+				sha256.update(chunk)
+				md5.update(chunk)
+				dst.write(chunk)
+		shutil.copystat(source, destination + '.tmp')
+		os.replace(destination + '.tmp', destination)
+	except BaseException:
+		# never leave a partial copy behind
+		try:
+			os.remove(destination + '.tmp')
+		except OSError:
 			pass
+		raise
+	countMetric('hashedBytes', os.stat(destination).st_size)
+	return sha256.hexdigest(), md5.hexdigest()
 
-	logging.debug("Got result")
-	logging.debug(result.content)
-	logging.debug(result.content.find(error_case))
-	local_end_time = datetime.datetime.now().time()
-	duration = datetime.datetime.combine(datetime.date.min,local_end_time)-datetime.datetime.combine(datetime.date.min,local_start_time)
-	return result
+# hashes of a file that is not copied byte by byte (linked, or already in place) - returns (sha256, md5)
+def fileHashes(fleNme):
+	sha256 = hashlib.sha256()
+	md5 = hashlib.md5()
+	with open(fleNme, 'rb') as fle:
+		while True:
+			chunk = fle.read(COPY_BUFFER)
+			if not chunk:
+				break
+			sha256.update(chunk)
+			md5.update(chunk)
+	countMetric('hashedBytes', os.stat(fleNme).st_size)
+	return sha256.hexdigest(), md5.hexdigest()
 
-# parse the spine or mods XML and enrich with valueURIs
-# Creates new folder structure for the book (emulates Medusa structure)
-# At end of this function we transform to get Medusa-json, rdf for book & rdf for emblems 
-def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirectory): 
+# Fixity manifest of a book's preservation folder - a csv row per file with its size, SHA-256 and MD5 and the source it was
+#	copied from (path, size, modification time in ns). Rows written by earlier runs are kept, so a resumed book's manifest
+#	still lists the files its earlier stages copied. The rows are also the folder's content index: which file holds a
+#	given SHA-256, and the sizes worth hashing a source for before copying it
+class FixityManifest:
+	COLUMNS = ['file', 'size', 'sha256', 'md5', 'source', 'sourceSize', 'sourceModified']
 
-	# instantiate root of retrieved XML content (spine) as an ET Element (root)
-    #   then instantiate an ET tree object from the root Element
-	root = ET.fromstring(spine)
-	tree1 = ET.ElementTree(root)
-	
-	# save the original mods or spine XML in supplementary folder
-	#    Use presence / absence of bibliosDesc and mods element to help determine file name
-	if len(tree1.xpath('//e:biblioDesc', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'}) ) > 0:
-		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_spine_orig.xml'
-		tree = ET.ElementTree(tree1.xpath('//e:biblioDesc', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})[0])
-	elif len(tree1.xpath('//m:mods', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'}) ) > 0 :
-		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_mods_orig.xml'
-		tree = ET.ElementTree(tree1.xpath('//m:mods', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})[0])
+	def __init__(self, fleNme):
+		self.fleNme = fleNme
+		self.lock = threading.Lock()
+		self.rows = {}
+		self.contents = {}
+		self.sizes = set()
+		self.changed = False
+		if os.path.isfile(fleNme):
+			with open(fleNme, newline='') as fle:
+				for row in csv.DictReader(fle):
+					self.rows[row['file']] = row
+					self.contents[row['sha256']] = row['file']
+					self.sizes.add(int(row['size']))
+
+	# True when the destination still holds the content an earlier copy of this same source put there
+	def holds(self, destination, source, sourceStat, destinationStat):
+		row = self.rows.get(destination.rsplit('\\', 1)[-1])
+		return row is not None and destinationStat is not None and row['source'] == source and int(row['size']) == destinationStat.st_size and int(row['sourceSize']) == sourceStat.st_size and int(row['sourceModified']) == sourceStat.st_mtime_ns
+
+	def add(self, destination, source, sourceStat, sha256, md5):
+		fileName = destination.rsplit('\\', 1)[-1]
+		with self.lock:
+			self.rows[fileName] = {'file' : fileName, 'size' : str(sourceStat.st_size), 'sha256' : sha256, 'md5' : md5, 'source' : source, 'sourceSize' : str(sourceStat.st_size), 'sourceModified' : str(sourceStat.st_mtime_ns)}
+			self.contents[sha256] = fileName
+			self.sizes.add(sourceStat.st_size)
+			self.changed = True
+
+	# True when a file of this size is listed, so a source of that size may be a duplicate worth hashing before the copy
+	def hasSize(self, size):
+		with self.lock:
+			return size in self.sizes
+
+	# path of another file in destination's folder listed with content sha256 and still that size, or None
+	def holder(self, destination, sha256, size):
+		folder, sep, fileName = destination.rpartition('\\')
+		with self.lock:
+			holderName = self.contents.get(sha256)
+			if holderName is None or holderName == fileName or self.rows[holderName]['sha256'] != sha256:
+				return None
+		try:
+			if os.stat(folder + sep + holderName).st_size != size:
+				return None
+		except OSError:
+			return None
+		return folder + sep + holderName
+
+	def write(self):
+		with self.lock:
+			if not self.changed:
+				return
+			with open(self.fleNme + '.tmp', 'w', newline='') as fle:
+				fixityWriter = csv.DictWriter(fle, fieldnames=self.COLUMNS)
+				fixityWriter.writeheader()
+				fixityWriter.writerows(self.rows[fileName] for fileName in sorted(self.rows))
+			os.replace(self.fleNme + '.tmp', self.fleNme)
+			self.changed = False
+
+def fixityFile(destinationDirectory, fqDestinationDirectory):
+	return fqDestinationDirectory + '\\supplementary\\' + destinationDirectory + '_fixity.csv'
+
+# copy one image - fixity is the book's FixityManifest for a preservation file, otherwise None
+@timedStage('copy')
+def copyImage(source, destination, fixity=None):
+	sourceStat = os.stat(source)
+	try:
+		destinationStat = os.stat(destination)
+	except FileNotFoundError:
+		destinationStat = None
+	if fixity is not None and fixity.holds(destination, source, sourceStat, destinationStat) :
+		countCopy('skipped', sourceStat.st_size)
+		return
+	if destinationStat is not None and destinationStat.st_size == sourceStat.st_size and abs(destinationStat.st_mtime - sourceStat.st_mtime) < 1 :
+		if fixity is not None :
+			fixity.add(destination, source, sourceStat, *fileHashes(destination))
+		countCopy('skipped', sourceStat.st_size)
+		return
+	if COPY_MODE == 'hardlink' or COPY_MODE == 'reflink':
+		try:
+			if destinationStat is not None:
+				os.remove(destination)
+			if COPY_MODE == 'hardlink':
+				os.link(source, destination)
+			else:
+				reflink(source, destination)
+			if fixity is not None :
+				fixity.add(destination, source, sourceStat, *fileHashes(source))
+			countCopy('linked', sourceStat.st_size)
+			return
+		except OSError as e:
+			logging.debug(COPY_MODE + ' failed for ' + destination + ', copying instead (' + str(e) + ')')
+	if fixity is not None :
+		if fixity.hasSize(sourceStat.st_size) :
+			hashes = fileHashes(source)
+			holder = fixity.holder(destination, hashes[0], sourceStat.st_size)
+			if holder is not None :
+				try:
+					if destinationStat is not None:
+						os.remove(destination)
+					os.link(holder, destination)
+					fixity.add(destination, source, sourceStat, *hashes)
+					countCopy('linked', sourceStat.st_size)
+					return
+				except OSError as e:
+					logging.debug('Linking ' + destination + ' to ' + holder + ' failed, copying instead (' + str(e) + ')')
+		fixity.add(destination, source, sourceStat, *hashedCopy(source, destination))
 	else :
-		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_orig.xml'
-		tree = tree1
-	tree.write(fleNme)
-	
-	# update (overwrite as necessary) the mods schema location and version number to mods 3.7
-	#    note need to specify mods schema location before setting spine schema location since spine schema imports mods 3.4, albeit using generic ver. 3 namespace URL
-	biblioD = tree.xpath('//e:biblioDesc', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-	for bd in biblioD:
-		#print('hello')
-		bd.attrib['{http://www.w3.org/2001/XMLSchema-instance}schemaLocation'] = "http://www.loc.gov/mods/v3 http://www.loc.gov/standards/mods/mods.xsd http://diglib.hab.de/rules/schema/emblem http://diglib.hab.de/rules/schema/emblem/emblem-1-2.xsd"
+		shutil.copy2(source, destination)
+	countCopy('copied', sourceStat.st_size)
 
-	modsR =	tree.xpath('//m:mods', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-	for mr in modsR:
-		mr.attrib['{http://www.w3.org/2001/XMLSchema-instance}schemaLocation'] = "http://www.loc.gov/mods/v3 http://www.loc.gov/standards/mods/mods.xsd"
-		mr.attrib['version'] = '3.7'
-		
-	# update [full resolution] emblem href URLs (those pointing to images stored on UIUC emblemImages server) consistent with planned relocation
-	emblems = tree.xpath("//e:emblem[@x:href]", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'x': 'http://www.w3.org/1999/xlink'})
-	for emblem in emblems :
-		aValue = emblem.attrib['{http://www.w3.org/1999/xlink}href'].replace(".grainger.", ".library.").replace("JP2Processed", "preservation")
-		emblem.attrib['{http://www.w3.org/1999/xlink}href'] = aValue
-    
-	picturas = tree.xpath("//e:emblem/e:pictura[@x:href]", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'x': 'http://www.w3.org/1999/xlink'})
-	for pictura in picturas:
-		picturaRawUrl = pictura.xpath("@x:href", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'x': 'http://www.w3.org/1999/xlink'})[0]
+def copyReport():
+	mb = 1024 * 1024
+	return 'image copies: %d copied (%.1f MB), %d linked (%.1f MB), %d already up to date (%.1f MB)' % (copyTotals['copied'], copyTotals['copiedBytes'] / mb, copyTotals['linked'], copyTotals['linkedBytes'] / mb, copyTotals['skipped'], copyTotals['skippedBytes'] / mb)
+
+# the image copies queued by one book; wait() blocks until they are all done, writes the book's fixity manifest
+#	(fixityFile, None for no manifest) with the copies that made it even when one failed, then raises the first failure.
+#	A destination queued twice in the same book is copied once, and a preservation file whose content the folder
+#	already holds under another name is linked to it (see FixityManifest)
+class CopyBatch:
+	def __init__(self, fixityFile=None):
+		self.jobs = []
+		self.destinations = set()
+		self.fixity = FixityManifest(fixityFile) if FIXITY_MANIFEST and fixityFile is not None else None
+
+	def copy(self, source, destination):
+		if destination in self.destinations:
+			return
+		self.destinations.add(destination)
+		fixity = self.fixity if '\\preservation\\' in destination else None
+		self.jobs.append(getCopyPool().submit(contextvars.copy_context().run, copyImage, source, destination, fixity))
+		if len(self.jobs) > 1000:
+			self.jobs = [job for job in self.jobs if not job.done() or job.exception() is not None]
+
+	@timedStage('copyWait')
+	def wait(self):
+		error = None
+		try:
+			while len(self.jobs) > 0:
+				try:
+					self.jobs.pop(0).result()
+				except Exception as e:
+					if error is None:
+						error = e
+		finally:
+			if self.fixity is not None:
+				self.fixity.write()
+		if error is not None:
+			raise error
+
+# point a pictura held on the UIUC djatoka server at its cantaloupe (IIIF) URL
+#	for pictura master stored on emblemImages, also copy the pictura jp2 file into preservation
+def relocatePictura(pictura, fqDestinationDirectory, sourceDirectory, copies):
+	picturaRawUrl = pictura.get(XLINK_HREF)
+	
+	if picturaRawUrl.find("djatoka.grainger.illinois.edu") != -1 :
+		picturaURL = "http://emblemimages.library.illinois.edu:8080/cantaloupe-4.1.4/iiif/2/"
+		picturaFile = picturaRawUrl.partition("rft_id=http://emblemimages.grainger.illinois.edu/")[2].partition(".jp2")[0] + ".jp2"
+		picturaURL = picturaURL+picturaFile.replace('JP2Processed', 'preservation').replace('/', '%2F')
+		picturaRegion = picturaRawUrl.partition('svc.region=' )[2].split(',')
+		picturaURL = picturaURL+'/'+picturaRegion[1]+','+picturaRegion[0]+','+picturaRegion[3]+','+picturaRegion[2]+'/full/0/default.jpg'
 		
-		if picturaRawUrl.find("djatoka.grainger.illinois.edu") != -1 :
-			picturaURL = "http://emblemimages.library.illinois.edu:8080/cantaloupe-4.1.4/iiif/2/"
-			picturaFile = picturaRawUrl.partition("rft_id=http://emblemimages.grainger.illinois.edu/")[2].partition(".jp2")[0] + ".jp2"
-			picturaURL = picturaURL+picturaFile.replace('JP2Processed', 'preservation').replace('/', '%2F')
-			picturaRegion = picturaRawUrl.partition('svc.region=' )[2].split(',')
-			picturaURL = picturaURL+'/'+picturaRegion[1]+','+picturaRegion[0]+','+picturaRegion[3]+','+picturaRegion[2]+'/full/0/default.jpg'
-			
-			pictura.attrib['{http://www.w3.org/1999/xlink}href'] = picturaURL
-			# for pictura master stored on emblemImages, copy pictura jp2 file into preservation 
-			if picturaRawUrl.find("emblemimages.grainger.illinois.edu") != -1 :
-				destPic = fqDestinationDirectory + '\\preservation\\' + picturaFile.split("/")[-1]					
-				sourcePic = sourceDirectory+ '\\JP2Processed\\' + picturaFile.split("/")[-1]
-				if os.path.exists(sourcePic) and os.path.isfile(sourcePic) :
-					shutil.copy2( sourcePic, destPic )					
-					
+		pictura.attrib['{http://www.w3.org/1999/xlink}href'] = picturaURL
+		# for pictura master stored on emblemImages, copy pictura jp2 file into preservation 
+		if picturaRawUrl.find("emblemimages.grainger.illinois.edu") != -1 :
+			destPic = fqDestinationDirectory + '\\preservation\\' + picturaFile.split("/")[-1]					
+			sourcePic = sourceDirectory+ '\\JP2Processed\\' + picturaFile.split("/")[-1]
+			if getSourceIndex(sourceDirectory).has('JP2Processed', picturaFile.split("/")[-1]) :
+				copies.copy( sourcePic, destPic )
+
+# adds authorityURI / valueURI to the book's MODS - languages, places, lcsh subjects, names and roleTerms
+#	and records the terms queried in the results sink
+@timedStage('enrichment')
+def enrichMods(nodes, destinationDirectory, fqDestinationDirectory):
+	# look up every distinct authority term in the book up front, concurrently - the enrichment below then reads
+	#	its answers from resolved instead of making one blocking request per term occurrence
+	resolved = resolveQueries(collectAuthorityQueries(nodes))
 
 	# adds valueURI for first languageTerm (in each language node) of type code by concatenating code value with id.loc.gov
 	#   assumes all language codes are either iso639-1 (2 characters) or iso639-2 (3 characters)
 	#	languageTerms of type code that already have a valueURI attribute are ignored
 	#	languageTerms of type code that have code values not 2 or 3 characters in length are ignored
-	langs = tree.xpath('//m:mods/m:language', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+	langs = nodes.languages
 	for lang in langs :
-		langTerm = lang.xpath("m:languageTerm[@type='code']", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+		langTerm = XP_LANGUAGE_CODE(lang)
 		if len(langTerm) > 0:
 			if langTerm[0].get('valueURI') is None:
 				ltS = langTerm[0].text
@@ -231,9 +1791,9 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 
 	# adds valueURI for first placeTerm (in each place node) of authority='marccountry' by concatenating placeTerm text value with id.loc.gov
 	#	placeTerms of authority='marccountry' that already have a valueURI attribute are ignored
-	places = tree.xpath('//m:mods/m:originInfo/m:place', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+	places = nodes.places
 	for place in places :
-		placeTerm = place.xpath("m:placeTerm[@authority='marccountry']", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+		placeTerm = XP_PLACE_MARCCOUNTRY(place)
 		if len(placeTerm) > 0:
 			if placeTerm[0].get('valueURI') is None:
 					placeText = placeTerm[0].text.lower().replace(".", " ").strip()
@@ -242,158 +1802,168 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 					placeTerm[0].attrib['valueURI'] = placeURI						
 					
 	
-	Subject = tree.xpath('//m:mods/m:subject[@authority="lcsh"]', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-	with open(destinationDirectory+'.csv', 'w', newline='') as t:
-		fieldnames = ['bookTitle', 'termQueried', 'numberofResult', 'valueURI']
-		thewriter = csv.DictWriter(t, fieldnames=fieldnames)						
-		thewriter.writeheader()
-		if len(Subject) > 0 :
-			for sub in Subject:
-				comSubMatchCount = 0
-				if len(sub) == 5:
-					subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() + '--' + sub[2].text.lower().replace(".", " ").strip() + sub[3].text.lower().replace(".", " ").strip() + sub[4].text.lower().replace(".", " ").strip()
-				elif len(sub) == 4:
-					subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() + '--' + sub[2].text.lower().replace(".", " ").strip() + sub[3].text.lower().replace(".", " ").strip()
-				elif len(sub) == 3:
-					subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() + '--' + sub[2].text.lower().replace(".", " ").strip()
-				elif len(sub) == 2:
-					subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() 
-				elif len(sub) == 1:
-					subText = sub[0].text.lower().replace(".", " ").strip()          
-						
-				lc_url = BASE_LC_Subjects + '%22'+subText+'%22'
-				rslt_tree = ET.HTML(getRequest(lc_url, False).content)
-				rslt_trs = rslt_tree.xpath("//table[@class='id-std']/tbody/tr")
-				rslt_tbody = rslt_tree.xpath("//table[@class='id-std']/tbody[@class='tbody-group']")
-				# only add valueURI if a single subject record is returned
-				if len(rslt_tbody) == 1 :	
-					sub.attrib['authorityURI'] = "http://id.loc.gov/" 
-					sub.attrib['valueURI'] = "http://id.loc.gov"+rslt_trs[0].xpath("./td/a[@title='Click to view record']/@href")[0]	
-					comSubMatchCount = 1
-				else:
-					comSubMatchCount = 0
+	Subject = nodes.subjects
+	if len(Subject) > 0 :
+		for sub in Subject:
+			comSubMatchCount = 0
+			if len(sub) == 5:
+				subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() + '--' + sub[2].text.lower().replace(".", " ").strip() + sub[3].text.lower().replace(".", " ").strip() + sub[4].text.lower().replace(".", " ").strip()
+			elif len(sub) == 4:
+				subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() + '--' + sub[2].text.lower().replace(".", " ").strip() + sub[3].text.lower().replace(".", " ").strip()
+			elif len(sub) == 3:
+				subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() + '--' + sub[2].text.lower().replace(".", " ").strip()
+			elif len(sub) == 2:
+				subText = sub[0].text.lower().replace(".", " ").strip() + '--' + sub[1].text.lower().replace(".", " ").strip() 
+			elif len(sub) == 1:
+				subText = sub[0].text.lower().replace(".", " ").strip()          
 					
-				thewriter.writerow({'bookTitle' : fqDestinationDirectory+'comSub', 'termQueried' : subText, 'numberofResult': comSubMatchCount})		
-					
-				# If len(sub) == 1, don't run the follows to avoid duplicated uri.							
-				if len(sub) > 1:
-					# if sub.get('valueURI') is None: 		
-					# process each subject of authority=lcsh that includes a <topic> child, and look for matches to <topic> value in LCSH
-					# ignore <topic> nodes that already have a valueURI
-					#   1st guess valueURI from <topic> value,
-					#   if not, check if <topic> value is itself a valueURI,
-					#   if not, search for exact match to <topic> value in LCSH			
-					subjectTerm = sub.xpath('m:topic', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-					
-					if len(subjectTerm) > 0 :
-						for idx, sT in enumerate(subjectTerm):
-							subMatchCount = 0
-							if subjectTerm[idx].get('valueURI') is None:
-								subjectText = subjectTerm[idx].text.lower().replace(".", " ").strip()
-								subjectURI = "http://id.loc.gov/authorities/subject/"+subjectText
-								
-								if subjectText in subjects.keys():
-									subjectTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-									subjectTerm[idx].attrib['valueURI'] = subjects[subjectText]	
-									subMatchCount = 1
-								elif subjectURI in subjects.values() :
+			lc_url = BASE_LC_Subjects + '%22'+subText+'%22'
+			rslt_tree = ET.HTML(lookupResolved(resolved, lc_url, False).content)
+			rslt_trs = XP_LC_ROWS(rslt_tree)
+			rslt_tbody = XP_LC_GROUPS(rslt_tree)
+			# only add valueURI if a single subject record is returned
+			if len(rslt_tbody) == 1 :	
+				sub.attrib['authorityURI'] = "http://id.loc.gov/" 
+				sub.attrib['valueURI'] = "http://id.loc.gov"+XP_LC_RECORD_HREF(rslt_trs[0])[0]	
+				comSubMatchCount = 1
+			else:
+				comSubMatchCount = 0
+				
+			recordResult(resolved, destinationDirectory, 'comSub', subText, comSubMatchCount, sub.get('valueURI'), lc_url)
+				
+			# If len(sub) == 1, don't run the follows to avoid duplicated uri.							
+			if len(sub) > 1:
+				# if sub.get('valueURI') is None: 		
+				# process each subject of authority=lcsh that includes a <topic> child, and look for matches to <topic> value in LCSH
+				# ignore <topic> nodes that already have a valueURI
+				#   1st guess valueURI from <topic> value,
+				#   if not, check if <topic> value is itself a valueURI,
+				#   if not, search for exact match to <topic> value in LCSH			
+				subjectTerm = XP_TOPIC(sub)
+				
+				if len(subjectTerm) > 0 :
+					for idx, sT in enumerate(subjectTerm):
+						subMatchCount = 0
+						termUrl = None
+						if subjectTerm[idx].get('valueURI') is None:
+							subjectText = subjectTerm[idx].text.lower().replace(".", " ").strip()
+							subjectURI = "http://id.loc.gov/authorities/subject/"+subjectText
+							
+							if subjectText in subjects.keys():
+								subjectTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
+								subjectTerm[idx].attrib['valueURI'] = subjects[subjectText]	
+								subMatchCount = 1
+							elif subjectURI in subjects.values() :
+								subjectTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
+								subjectTerm[idx].attrib['valueURI'] = subjectURI
+								subMatchCount = 1
+							else :
+								lc_url = BASE_LC_Subjects + '%22'+subjectText+'%22'
+								termUrl = lc_url
+								print(lc_url)
+								rslt_tree = ET.HTML(lookupResolved(resolved, lc_url, False).content)
+								rslt_trs = XP_LC_ROWS(rslt_tree)
+								if len(rslt_trs) > 0:
+									print("match")
 									subjectTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-									subjectTerm[idx].attrib['valueURI'] = subjectURI
+									subjectTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+XP_LC_RECORD_HREF(rslt_trs[0])[0]
 									subMatchCount = 1
-								else :
-									lc_url = BASE_LC_Subjects + '%22'+subjectText+'%22'
-									print(lc_url)
-									rslt_tree = ET.HTML(getRequest(lc_url, False).content)
-									rslt_trs = rslt_tree.xpath("//table[@class='id-std']/tbody/tr")
-									if len(rslt_trs) > 0:
-										print("match")
-										subjectTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-										subjectTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+rslt_trs[0].xpath("./td/a[@title='Click to view record']/@href")[0]
-										subMatchCount = 1
-							else:
-								subjectText = "valueURI already present."
-											
-							thewriter.writerow({'bookTitle' : fqDestinationDirectory+'sub', 'termQueried' : subjectText, 'numberofResult': subMatchCount})	
-							
+						else:
+							subjectText = "valueURI already present."
+										
+						recordResult(resolved, destinationDirectory, 'sub', subjectText, subMatchCount, sT.get('valueURI'), termUrl)
+						
+						
 							
+				# process each subject of authority=lcsh that includes a <geographic> child, and look for matches to <geographic> value in LCSH
+				geoTerm = XP_GEOGRAPHIC(sub)
+				if len(subjectTerm) > 0 :
+					for idx, gA in enumerate(geoTerm):
+						geoSubMatchCount = 0
+						termUrl = None
+						if geoTerm[idx].get('valueURI') is None:
+							geoText = geoTerm[idx].text.lower().replace(".", " ").strip()
+							geoURI = "http://id.loc.gov/vocabulary/geographicAreas/"+geoText
+							if geoText in geoAreas.keys():
+								geoTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
+								geoTerm[idx].attrib['valueURI'] = geoAreas[geoText]	
+								geoSubMatchCount = 1
+							elif geoURI in geoAreas.values() :
+								geoTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
+								geoTerm[idx].attrib['valueURI'] = geoURI
+								geoSubMatchCount = 1
 								
-					# process each subject of authority=lcsh that includes a <geographic> child, and look for matches to <geographic> value in LCSH
-					geoTerm = sub.xpath('m:geographic', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-					if len(subjectTerm) > 0 :
-						for idx, gA in enumerate(geoTerm):
-							geoSubMatchCount = 0
-							if geoTerm[idx].get('valueURI') is None:
-								geoText = geoTerm[idx].text.lower().replace(".", " ").strip()
-								geoURI = "http://id.loc.gov/vocabulary/geographicAreas/"+geoText
-								if geoText in geoAreas.keys():
-									geoTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-									geoTerm[idx].attrib['valueURI'] = geoAreas[geoText]	
-									geoSubMatchCount = 1
-								elif geoURI in geoAreas.values() :
+							else :
+								geo_url = BASE_LC_MARCGAC + '%22'+geoText+'%22'
+								termUrl = geo_url
+								rslt_tree = ET.HTML(lookupResolved(resolved, geo_url, False).content)
+								rslt_trs = XP_LC_ROWS(rslt_tree)
+								if len(rslt_trs) > 0:
 									geoTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-									geoTerm[idx].attrib['valueURI'] = geoURI
-									geoSubMatchCount = 1
+									geoTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+XP_LC_RECORD_HREF(rslt_trs[0])[0]
+									geoSubMatchCount = 1	
+						else:
+							geoText = "valueURI already present."
 									
-								else :
-									geo_url = BASE_LC_MARCGAC + '%22'+geoText+'%22'
-									rslt_tree = ET.HTML(getRequest(geo_url, False).content)
-									rslt_trs = rslt_tree.xpath("//table[@class='id-std']/tbody/tr")
-									if len(rslt_trs) > 0:
-										geoTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-										geoTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+rslt_trs[0].xpath("./td/a[@title='Click to view record']/@href")[0]
-										geoSubMatchCount = 1	
-										
-							thewriter.writerow({'bookTitle' : fqDestinationDirectory+'geoSub', 'termQueried' : geoText, 'numberofResult': geoSubMatchCount})
-							
-					genreTerm = sub.xpath('m:genre', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-					if len(genreTerm) > 0 :
-						for idx, genre in enumerate(genreTerm):
-							gnrSubMatchCount = 0
-							if genreTerm[idx].get('valueURI') is None:
-								genreText = genreTerm[idx].text.lower().replace(".", " ").strip()
-								if genreText in genreSubjects.keys():
+						recordResult(resolved, destinationDirectory, 'geoSub', geoText, geoSubMatchCount, gA.get('valueURI'), termUrl)
+						
+				genreTerm = XP_GENRE(sub)
+				if len(genreTerm) > 0 :
+					for idx, genre in enumerate(genreTerm):
+						gnrSubMatchCount = 0
+						termUrl = None
+						if genreTerm[idx].get('valueURI') is None:
+							genreText = genreTerm[idx].text.lower().replace(".", " ").strip()
+							if genreText in genreSubjects.keys():
+								genreTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
+								genreTerm[idx].attrib['valueURI'] = genreSubjects[genreText]
+								gnrSubMatchCount = 1
+							else :
+								genre_url = BASE_LC_genreSubjects + '%22'+genreText+'%22'
+								termUrl = genre_url
+								rslt_tree = ET.HTML(lookupResolved(resolved, genre_url, False).content)
+								rslt_trs = XP_LC_ROWS(rslt_tree)
+								if len(rslt_trs) > 0:
 									genreTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-									genreTerm[idx].attrib['valueURI'] = genreSubjects[genreText]
+									genreTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+XP_LC_RECORD_HREF(rslt_trs[0])[0]
 									gnrSubMatchCount = 1
-								else :
-									genre_url = BASE_LC_genreSubjects + '%22'+genreText+'%22'
-									rslt_tree = ET.HTML(getRequest(genre_url, False).content)
-									rslt_trs = rslt_tree.xpath("//table[@class='id-std']/tbody/tr")
-									if len(rslt_trs) > 0:
-										genreTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-										genreTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+rslt_trs[0].xpath("./td/a[@title='Click to view record']/@href")[0]
-										gnrSubMatchCount = 1
-										
-							thewriter.writerow({'bookTitle' : fqDestinationDirectory+'gnrSub', 'termQueried' : genreText, 'numberofResult': gnrSubMatchCount})
+						else:
+							genreText = "valueURI already present."
+									
+						recordResult(resolved, destinationDirectory, 'gnrSub', genreText, gnrSubMatchCount, genre.get('valueURI'), termUrl)
                                         
                 # process each subject of authority=lcsh that includes a <name> child, and look for matches to <namePart> value in LCSH
                 # <name> child stands alone within <subject> (i.e. len(sub) == 1), so this node needs to be indented back, and we can append authorityURI and valueURI directly to sub
-				nmeSub = sub.xpath('m:name', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})			
-				if len(nmeSub) > 0 :										
-					for idx, nme in enumerate(nmeSub):
-						nmeSubMatchCount = 0
-						if nmeSub[idx].get('valueURI') is None:		
-							nmeParts = nme.xpath('m:namePart', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})							
-							if len(nmeParts) == 3:							
-								nmeText = nmeParts[1].text.lower().replace(".", " ").strip() + ',' + ' ' + nmeParts[0].text.lower().replace(".", " ").strip() + ',' + ' ' + nmeParts[2].text.lower().replace(".", " ").strip()
-							elif len(nmeParts) == 2:							
-								nmeText = nmeParts[0].text.lower().replace(".", " ").strip() + ',' + ' ' + nmeParts[1].text.lower().replace(".", " ").strip() 
-							elif len(nmeParts) == 1:							
-								nmeText = nmeParts[0].text.lower().replace(".", " ").strip() 
-							if nmeText in nmeSubjects.keys():
+			nmeSub = XP_NAME(sub)			
+			if len(nmeSub) > 0 :										
+				for idx, nme in enumerate(nmeSub):
+					nmeSubMatchCount = 0
+					termUrl = None
+					if nmeSub[idx].get('valueURI') is None:		
+						nmeParts = XP_NAMEPART(nme)							
+						if len(nmeParts) == 3:							
+							nmeText = nmeParts[1].text.lower().replace(".", " ").strip() + ',' + ' ' + nmeParts[0].text.lower().replace(".", " ").strip() + ',' + ' ' + nmeParts[2].text.lower().replace(".", " ").strip()
+						elif len(nmeParts) == 2:							
+							nmeText = nmeParts[0].text.lower().replace(".", " ").strip() + ',' + ' ' + nmeParts[1].text.lower().replace(".", " ").strip() 
+						elif len(nmeParts) == 1:							
+							nmeText = nmeParts[0].text.lower().replace(".", " ").strip() 
+						if nmeText in nmeSubjects.keys():
+							sub.attrib['authorityURI'] = "http://id.loc.gov/" 
+							sub.attrib['valueURI'] = nmeSubjects[nmeText]	
+							nmeSubMatchCount = 1
+						else :
+							nme_url = BASE_LC_NmeSubjects + '%22'+nmeText+'%22'
+							termUrl = nme_url
+							rslt_tree = ET.HTML(lookupResolved(resolved, nme_url, False).content)
+							rslt_trs = XP_LC_ROWS(rslt_tree)
+							if len(rslt_trs) > 0:
 								sub.attrib['authorityURI'] = "http://id.loc.gov/" 
-								sub.attrib['valueURI'] = nmeSubjects[nmeText]	
-								nmeSubMarchCount = 1
-							else :
-								nme_url = BASE_LC_NmeSubjects + '%22'+nmeText+'%22'
-								rslt_tree = ET.HTML(getRequest(nme_url, False).content)
-								rslt_trs = rslt_tree.xpath("//table[@class='id-std']/tbody/tr")
-								if len(rslt_trs) > 0:
-									sub.attrib['authorityURI'] = "http://id.loc.gov/" 
-									sub.attrib['valueURI'] = "http://id.loc.gov"+rslt_trs[0].xpath("./td/a[@title='Click to view record']/@href")[0]
-									nmeSubMarchCount = 1	
-									
-						thewriter.writerow({'bookTitle' : fqDestinationDirectory+'nmeSub', 'termQueried' : nmeText, 'numberofResult': nmeSubMatchCount})
+								sub.attrib['valueURI'] = "http://id.loc.gov"+XP_LC_RECORD_HREF(rslt_trs[0])[0]
+								nmeSubMatchCount = 1	
+					else:
+						nmeText = "valueURI already present."
+								
+					recordResult(resolved, destinationDirectory, 'nmeSub', nmeText, nmeSubMatchCount, sub.get('valueURI'), termUrl)
 						
 	# process each name node to add viaf and role valueURIs
 	# 	Ignore if valueURI already present
@@ -403,17 +1973,13 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 	#		otherwise if no namePart[0], do not search for viaf url
 	#   strip out parens characters since VIAF api doesn't seem to like
 	#   assume json response
-	nmes = tree.xpath('//m:mods/m:name', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-	#with open(destinationDirectory+'.csv', 'w', newline='') as t:
-		#fieldnames = ['bookTitle', 'termQueried', 'numberofResult', 'valueURI']
-		#thewriter = csv.DictWriter(t, fieldnames=fieldnames)						
-		#thewriter.writeheader()
-		
+	nmes = nodes.names
 	for nme in nmes :
 		matchCount = 0
+		viaf_url = None
 		if nme.get('valueURI') is None :
-			nmeParts = nme.xpath('m:namePart', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-			df = nme.xpath('m:displayForm', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+			nmeParts = XP_NAMEPART(nme)
+			df = XP_DISPLAYFORM(nme)
 			dfCurrent = False
 			if len(df) == 1:
 				nmePart = df[0].text
@@ -428,7 +1994,7 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 				nmePart = nmePart.replace("(", "")
 				nmePart = nmePart.replace(")", "")
 				viaf_url = BASE_VIAF_URL + nmePart
-				rslt = getRequest(viaf_url, True)		
+				rslt = lookupResolved(resolved, viaf_url, True)		
 				myNmeJ = json.loads(rslt.content.decode('utf-8'))
 				if myNmeJ['result'] is not None:
 					# only add valueURI if a single VIAF record (result.item) of type personal or corporate is returned
@@ -455,10 +2021,10 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 				else :
 					matchCount = 0
 	
-			#thewriter.writerow({'bookTitle' : fqDestinationDirectory, 'termQueried' : nmePart, 'numberofResult': matchCount})
+			recordResult(resolved, destinationDirectory, 'name', nmePart, matchCount, nme.get('valueURI'), viaf_url)
 		else :
-			nmeParts = nme.xpath('m:namePart', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-			df = nme.xpath('m:displayForm', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+			nmeParts = XP_NAMEPART(nme)
+			df = XP_DISPLAYFORM(nme)
 			dfCurrent = False
 			if len(df) == 1:
 				nmePart = df[0].text
@@ -472,18 +2038,20 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 			if nmePart != "No namePart provided.":
 				nmePart = nmePart.replace("(", "")
 				nmePart = nmePart.replace(")", "")
-			valueURI = nme.get('valueURI')
-			#thewriter.writerow({'bookTitle' : fqDestinationDirectory, 'termQueried' : nmePart, 'numberofResult': 'valueURI present in original XML', 'valueURI': valueURI})
+			# matchCount None - not looked up, valueURI present in original XML
+			recordResult(resolved, destinationDirectory, 'name', nmePart, None, nme.get('valueURI'))
 				
 	
 			# Now check each roleTerm to see if you have a value that maps to a URL or if you can find a match on id.loc.gov
 			# 	Note, this is template for hybrid dictionary plus online lookup
 			#   Ignore any roleTerm that already has a valueURI in our data dictionary
 			#    If not, search id.loc.gov for *exact* match to a MARC relator role
-		roleTerm = nme.xpath('m:role/m:roleTerm', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+		roleTerm = nodes.roleTerms[nme]
 		if len(roleTerm) > 0 :
 			for idx, rT in enumerate(roleTerm):
 				if roleTerm[idx].get('valueURI') is None:
+					roleMatchCount = 1
+					lc_url = None
 					roleText = roleTerm[idx].text.lower().replace(".", " ").strip()
 					roleURI = "http://id.loc.gov/vocabulary/relators/"+roleText
 					if roleText in relators.keys() :
@@ -494,129 +2062,660 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 						roleTerm[idx].attrib['valueURI'] = roleURI						
 					else :
 						lc_url = BASE_LC_Relators + '%22'+roleText+'%22'
-						rslt_tree = ET.HTML(getRequest(lc_url, False).content)
-						rslt_trs = rslt_tree.xpath("//table[@class='id-std']/tbody/tr")
+						rslt_tree = ET.HTML(lookupResolved(resolved, lc_url, False).content)
+						rslt_trs = XP_LC_ROWS(rslt_tree)
 						if len(rslt_trs) > 0:
 							roleTerm[idx].attrib['authorityURI'] = "http://id.loc.gov/" 
-							roleTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+rslt_trs[0].xpath("./td/a[@title='Click to view record']/@href")[0]
+							roleTerm[idx].attrib['valueURI'] = "http://id.loc.gov"+XP_LC_RECORD_HREF(rslt_trs[0])[0]
+						else:
+							roleMatchCount = 0
+					recordResult(resolved, destinationDirectory, 'role', roleText, roleMatchCount, rT.get('valueURI'), lc_url)
 
+# save the enriched tree in supplementary
+def writeEnrichedTree(tree, nodes, destinationDirectory, fqDestinationDirectory):
 	# now save the XML tree as enriched spine or mods file
-	if len(tree.xpath('//e:biblioDesc', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'}) ) > 0:
+	if len(nodes.biblioDescs) > 0:
 		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_spine.xml'
-	elif len(tree.xpath('//m:mods', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'}) ) > 0 :
+	elif len(nodes.mods) > 0 :
 		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_mods.xml'
 	else :
 		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'.xml'
 	tree.write(fleNme)
 
+# Run-level NDJSON stream of json-ld documents, with a tab separated offset index. A new stream starts after the parts
+#	already on disk, so an earlier run's parts are kept and the index lists both
+class RdfStream:
+	def __init__(self, baseName):
+		self.lock = threading.Lock()
+		self.baseName = baseName
+		self.part = 0
+		self.fle = None
+		self.partNme = None
+		self.size = 0
+		self.documents = 0
+		self.index = open(baseName + '.index', 'a', encoding='utf-8')
+
+	def append(self, kind, book, docId, content):
+		try:
+			line = json.dumps(json.loads(content.decode('utf-8'), strict=False), ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+		except ValueError as e:
+			logging.warning('Not streamed, ' + kind + ' ' + docId + ' of ' + book + ' is not json (' + str(e) + ')')
+			return
+		if RDF_STREAM_GZIP:
+			line = gzip.compress(line, mtime=0)
+		with self.lock:
+			if self.fle is None or self.size >= RDF_STREAM_MAX_BYTES:
+				self.nextPart()
+			self.index.write(kind + '\t' + book + '\t' + docId + '\t' + self.partNme + '\t' + str(self.size) + '\t' + str(len(line)) + '\n')
+			self.fle.write(line)
+			self.size += len(line)
+			self.documents += 1
+
+	def nextPart(self):
+		if self.fle is not None:
+			self.fle.close()
+		while True:
+			self.part += 1
+			partNme = self.baseName + '-' + str(self.part).rjust(4, '0') + ('.ndjson.gz' if RDF_STREAM_GZIP else '.ndjson')
+			if not os.path.exists(partNme):
+				break
+		self.partNme = partNme
+		self.fle = open(partNme, 'wb')
+		self.size = 0
+
+	def flush(self):
+		with self.lock:
+			if self.fle is not None:
+				self.fle.flush()
+			self.index.flush()
+
+	def close(self):
+		with self.lock:
+			if self.fle is not None:
+				self.fle.close()
+			self.index.close()
+
+rdfStream = None
+rdfStreamLock = threading.Lock()
+
+def getRdfStream():
+	global rdfStream
+	if RDF_STREAM_FILE is None:
+		return None
+	if rdfStream is None:
+		with rdfStreamLock:
+			if rdfStream is None:
+				rdfStream = RdfStream(RDF_STREAM_FILE)
+	return rdfStream
+
+# append a json-ld document to the rdf stream, when there is one
+def streamRdf(kind, book, docId, content):
+	stream = getRdfStream()
+	if stream is not None:
+		stream.append(kind, book, docId, content)
+
+# transform the book's tree to its Medusa-like json and schema.org json-ld
+def transformBook(tree, destinationDirectory, fqDestinationDirectory):
+	transform, transformMods2Rdf = getTransforms()[:2]
+
 	# transform the XML tree for the book to 'Medusa'-like json
-	result = transform(tree)
+	with timed('xsltBookJson'):
+		result = transform(tree)
 	fleNme = fqDestinationDirectory+'\\'+destinationDirectory+'.json'
 	with open(fleNme, 'wb') as f:
 		f.write(result)
 
 	# transform the XML tree for the book to schema.org json-ld
 	bookFldr = ET.XSLT.strparam(destinationDirectory)
-	result = transformMods2Rdf(tree, docName=bookFldr)
+	with timed('xsltBookRdf'):
+		result = transformMods2Rdf(tree, docName=bookFldr)
 	fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_rdf.json'
 	with open(fleNme, 'wb') as f:
 		f.write(result)
-		
-#	Now we need to create rdf for each emblem
-#	Start by getting node list of all the emblems (if any) in the [spine] XML metadata file
-	emblems = tree.xpath('//e:emblem', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-
-#	emblemTree = ET.ElementTree(emblems[3])
-#	emblemTree.write("singleEmblem.xml")
+	streamRdf('book', destinationDirectory, destinationDirectory, bytes(result))
 
-# 	generate dateCreated param needed for emblem transform - same for each emblem in this book - use mods:dateIssued
-	dateIssued=tree.xpath("//m:mods/m:originInfo/m:dateIssued[@encoding='marc' or @encoding='iso8601']", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-	dateIssued2=tree.xpath("//m:mods/m:originInfo/m:dateIssued", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+# generate dateCreated param needed for emblem transform - same for each emblem in this book - use mods:dateIssued
+def emblemDateCreated(nodes):
+	dateIssued=nodes.codedDatesIssued()
+	dateIssued2=nodes.datesIssued
 	
 	if len(dateIssued) > 0:
-		dateIssuedFromMods= ET.XSLT.strparam(dateIssued[0].text)
+		dateIssuedFromMods= dateIssued[0].text
 	elif len(dateIssued2) > 0:
-		dateIssuedFromMods= ET.XSLT.strparam(dateIssued2[0].text)	
+		dateIssuedFromMods= dateIssued2[0].text
 	else:
-		dateIssuedFromMods= ET.XSLT.strparam(" ")
+		dateIssuedFromMods= " "
+	return dateIssuedFromMods
+
+# Emblem RDF process pool - with EMBLEM_PROCESSES > 0 the CPU-bound emblem transforms run in worker processes, each
+#	compiling the emblem xsl once at startup; the book's threads keep doing the copying and enrichment
+emblemPool = None
+emblemPoolLock = threading.Lock()
+workerEmblem2Rdf = None
+
+def emblemRdfPool():
+	global emblemPool
+	if emblemPool is None:
+		with emblemPoolLock:
+			if emblemPool is None:
+				emblemPool = concurrent.futures.ProcessPoolExecutor(EMBLEM_PROCESSES, initializer=initEmblemWorker)
+	return emblemPool
+
+def initEmblemWorker():
+	global workerEmblem2Rdf
+	workerEmblem2Rdf = ET.XSLT(ET.parse('spineEmblem2rdfJson4Aug.xsl'))
+
+# transform an emblem to rdf and save it - shared by the serial path and the pool workers so both write the same files
+#	returns the json-ld written
+def emblem2Rdf(transformEmblem2Rdf, emblemTree, docName, dateCreated, picturaURL, emblemPageImageList, fleNme):
+	result = transformEmblem2Rdf(emblemTree, docName=ET.XSLT.strparam(docName), dateCreated=ET.XSLT.strparam(dateCreated), picturaURL=ET.XSLT.strparam(picturaURL), emblemPageImageList=ET.XSLT.strparam(emblemPageImageList) )
+	with open(fleNme, 'wb') as f:
+		f.write(result)
+	return bytes(result)
+
+# runs in a pool worker on an emblem serialized by processEmblem
+#	returns the seconds the transform took, for the metrics of the book that queued it, and when streamId is given
+#	(streamId, json-ld) for the rdf stream - which is written by the main process
+def emblemRdfJob(emblemXml, docName, dateCreated, picturaURL, emblemPageImageList, fleNme, streamId=None):
+	start = time.perf_counter()
+	result = emblem2Rdf(workerEmblem2Rdf, ET.ElementTree(ET.fromstring(emblemXml)), docName, dateCreated, picturaURL, emblemPageImageList, fleNme)
+	return time.perf_counter() - start, (streamId, result) if streamId is not None else None
+
+# wait for queued emblem transforms until no more than keep are outstanding, raising the first failure
+def waitEmblemJobs(jobs, keep=0):
+	while len(jobs) > keep:
+		seconds, streamed = jobs.pop(0).result()
+		if METRICS_ENABLED:
+			getMetrics().stage('xsltEmblemRdf', seconds)
+		if streamed is not None:
+			(book, emblemId), result = streamed
+			streamRdf('emblem', book, emblemId, result)
+
+# the page images of a stitched emblem master (<book>_<first>-<last>.jp2), None for a single page master
+def stitchedPages(stitchedFile):
+	myFrag2 = stitchedFile.rpartition('_')
+	if myFrag2[2].find("-") == -1 :
+		return None
+	myFrag3 = myFrag2[2].split('.')[0].split('-', 1)
+	max = int(myFrag3[1])
+	min = int(myFrag3[0])
+	return [myFrag2[0] + '_' + str(min+x).rjust(4, '0') + '.jp2' for x in range(max-min+1)]
+
+# emblemPageImageList param of the emblem transform - the pages of a stitched master stored on emblemImages, ' |' after each
+def pageImageList(stitchedUrl):
+	if stitchedUrl.find("emblemimages.library.illinois.edu") == -1:
+		return " "
+	pages = stitchedPages(stitchedUrl.rsplit('/', 1)[1])
+	if pages is None:
+		return " "
+	return ''.join(pg + ' |' for pg in pages)
+
+# Create tree for the emblem and get emblemId (from globalID)
+#	emblemId will be used to save xml and rdf file and will (separately) be used (required) by xslt that transforms emblem metadata to rdf
+#	queues the emblem's thumbnail and preservation master copies on copies, then transforms the emblem to rdf
+#	in pool mode the transform is queued and its future returned, otherwise None
+@timedStage('emblem')
+def processEmblem(emblem, bookFldr, dateIssuedFromMods, fqDestinationDirectory, sourceDirectory, copies):
+	emblemTree = ET.ElementTree(emblem)
+	emblemId = XP_EMBLEM_ID(emblem)
+	emblem2Id = XP_EMBLEM_XMLID(emblem)
+	sourceIndex = getSourceIndex(sourceDirectory)
 	
-#	Create tree for each emblem and get emblemId (from globalID) 
-#		emblemId will be used to save xml and rdf file and will (separately) be used (required) by xslt that transforms emblem metadata to rdf
-	for emblem in emblems:
-		emblemTree = ET.ElementTree(emblem)
-		emblemId = emblemTree.xpath('substring-after(/e:emblem/@globalID,"EmblemRegistry:")', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
-		emblem2Id = emblemTree.xpath('string(/e:emblem/@xml:id)', namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'm': 'http://www.loc.gov/mods/v3'})
+	if len(emblemId) > 0 :
+
+		fleNme = fqDestinationDirectory+'\\emblematica\\emblem'+emblemId[1:]+'.xml'
+		emblemTree.write(fleNme)
+
 		
-		if len(emblemId) > 0 :
+		sourceEmbThumb = sourceDirectory + '\\JPGthumbnail\\emblem\\' + emblemId + '.jpg'
+		source2EmbThumb = sourceDirectory + '\\JPGthumbnail\\emblem\\' + emblem2Id + '.jpg'
+		destEmbThumb = fqDestinationDirectory + '\\_access\\emblem\\' + emblemId + '.jpg'
+		if sourceIndex.has('JPGthumbnail\\emblem', emblemId + '.jpg') :
+			copies.copy( sourceEmbThumb, destEmbThumb )
+		elif sourceIndex.has('JPGthumbnail\\emblem', emblem2Id + '.jpg') :
+			copies.copy( source2EmbThumb, destEmbThumb )
+		else :
+			reportMissing(bookFldr, emblemId, 'emblem thumbnail', sourceEmbThumb)
+		
+		sourcePicThumb = sourceDirectory + '\\JPGthumbnail\\pictura\\' + emblemId + '.jpg'
+		source2PicThumb = sourceDirectory + '\\JPGthumbnail\\pictura\\' + emblem2Id + '.jpg'
+		destPicThumb = fqDestinationDirectory + '\\_access\\pictura\\' + emblemId + '.jpg'
+		if sourceIndex.has('JPGthumbnail\\pictura', emblemId + '.jpg') :
+			copies.copy( sourcePicThumb, destPicThumb )
+		elif sourceIndex.has('JPGthumbnail\\pictura', emblem2Id + '.jpg') :
+			copies.copy( source2PicThumb, destPicThumb )
+		else :
+			reportMissing(bookFldr, emblemId, 'pictura thumbnail', sourcePicThumb)
 
-			fleNme = fqDestinationDirectory+'\\emblematica\\emblem'+emblemId[1:]+'.xml'
-			emblemTree.write(fleNme)
+#			Another param for the transform - For each pictura saved on uiuc server, update url from djatoka to cantaloupe
+		picturaURL = XP_EMBLEM_PICTURA_HREF(emblem)
 
+		# Lastly we need to generate a param containing list of individual page images that comprise the emblem
+		# Note - by design only checking UIUC, Duke and Getty for stitched image files (all of which will be on emblemImages)
+		#   check if emblem master same as used for destPic / sourcePic, in which case you can skip that one multi-page version of emblem jp2.
+		stitchedUrl = XP_EMBLEM_HREF(emblem)
+		emblemPageImageList = pageImageList(stitchedUrl)
+		if stitchedUrl.find("emblemimages.library.illinois.edu") != -1:
+			stitchedFile = stitchedUrl.rsplit('/', 1)[1]
+			# For emblem masters stored on emblemImages, copy emblem jp2 file in preservation
+			destEmb = fqDestinationDirectory + '\\preservation\\' + stitchedFile
+			sourceEmb = sourceDirectory + '\\JP2Processed\\' + stitchedFile
 			
-			sourceEmbThumb = sourceDirectory + '\\JPGthumbnail\\emblem\\' + emblemId + '.jpg'
-			source2EmbThumb = sourceDirectory + '\\JPGthumbnail\\emblem\\' + emblem2Id + '.jpg'
-			destEmbThumb = fqDestinationDirectory + '\\_access\\emblem\\' + emblemId + '.jpg'
-			if os.path.exists(sourceEmbThumb) and os.path.isfile(sourceEmbThumb) :
-				shutil.copy2( sourceEmbThumb, destEmbThumb )
-			elif os.path.exists(source2EmbThumb) and os.path.isfile(source2EmbThumb) :
-				shutil.copy2( source2EmbThumb, destEmbThumb )
+			# an emblem master that is also the pictura master (destEmb == destPic) is copied once - the book's CopyBatch
+			#	skips destinations it has already queued, and the fixity manifest those it copied in an earlier run
+			if sourceIndex.has('JP2Processed', stitchedFile):
+				copies.copy( sourceEmb, destEmb)
+			else :
+				reportMissing(bookFldr, emblemId, 'emblem image', sourceEmb)
 			
-			sourcePicThumb = sourceDirectory + '\\JPGthumbnail\\pictura\\' + emblemId + '.jpg'
-			source2PicThumb = sourceDirectory + '\\JPGthumbnail\\pictura\\' + emblem2Id + '.jpg'
-			destPicThumb = fqDestinationDirectory + '\\_access\\pictura\\' + emblemId + '.jpg'
-			if os.path.exists(sourcePicThumb) and os.path.isfile(sourcePicThumb) :
-				shutil.copy2( sourcePicThumb, destPicThumb )
-			elif os.path.exists(source2PicThumb) and os.path.isfile(source2PicThumb) :
-				shutil.copy2( source2PicThumb, destPicThumb )
-
-#			Another param for the transform - For each pictura saved on uiuc server, update url from djatoka to cantaloupe
-			picturaRawUrl = emblemTree.xpath("string(/e:emblem/e:pictura/@xlink:href)", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'xlink': 'http://www.w3.org/1999/xlink'})
-			picturaURL = ET.XSLT.strparam(picturaRawUrl)
-
-			# Lastly we need to generate a param containing list of individual page images that comprise the emblem
-			# Note - by design only checking UIUC, Duke and Getty for stitched image files (all of which will be on emblemImages)
-			#   check if emblem master same as used for destPic / sourcePic, in which case you can skip that one multi-page version of emblem jp2.
-			stitchedUrl = emblemTree.xpath("string(/e:emblem/@xlink:href)", namespaces={'e': 'http://diglib.hab.de/rules/schema/emblem', 'xlink': 'http://www.w3.org/1999/xlink'})
-			emblemPageImageList = ET.XSLT.strparam(" ")
-			if stitchedUrl.find("emblemimages.library.illinois.edu") != -1:
-				stitchedFile = stitchedUrl.rsplit('/', 1)[1]
-				# For emblem masters stored on emblemImages, copy emblem jp2 file in preservation
-				destEmb = fqDestinationDirectory + '\\preservation\\' + stitchedFile
-				sourceEmb = sourceDirectory + '\\JP2Processed\\' + stitchedFile
-				
-				#if destEmb != destPic and os.path.exists(sourceEmb) and os.path.isfile(sourceEmb):
-				if os.path.exists(sourceEmb) and os.path.isfile(sourceEmb):
-					shutil.copy2( sourceEmb, destEmb)
+			pages = stitchedPages(stitchedFile)
+			if pages is not None :
+				for pg in pages:
+					#   TODO: for stitched, copy each individual page image file into preservation....
 				
-				myFrag2 = stitchedFile.rpartition('_')
-				if myFrag2[2].find("-") != -1 :
-					myFrag3 = myFrag2[2].split('.')[0].split('-', 1)
-					max = int(myFrag3[1])
-					min = int(myFrag3[0])
-					imageList = ""
-					for x in range(max-min+1):
-						pg = myFrag2[0] + '_' + str(min+x).rjust(4, '0') + '.jp2'
-						#   TODO: for stitched, copy each individual page image file into preservation....
+					destEmb = fqDestinationDirectory + '\\preservation\\' + pg
+					sourceEmb = sourceDirectory + '\\JP2Processed\\' + pg
 					
-						destEmb = fqDestinationDirectory + '\\preservation\\' + pg
-						sourceEmb = sourceDirectory + '\\JP2Processed\\' + pg
-						
-						if os.path.exists(sourceEmb) and os.path.isfile(sourceEmb):
-							shutil.copy2( sourceEmb, destEmb)
-							
-						imageList = imageList + pg + ' |'
-					
-					emblemPageImageList = ET.XSLT.strparam(imageList)
-					
-			
-			# Finally we're ready to generate emblem RDF via transform
-			result = transformEmblem2Rdf(emblemTree, docName=bookFldr, dateCreated=dateIssuedFromMods, picturaURL=picturaURL, emblemPageImageList=emblemPageImageList )
-			fleNme = fqDestinationDirectory+'\\supplementary\\'+emblemId+'_rdf.json'
-			with open(fleNme, 'wb') as f:
-				f.write(result)
+					if sourceIndex.has('JP2Processed', pg):
+						copies.copy( sourceEmb, destEmb)
+					else :
+						reportMissing(bookFldr, emblemId, 'page image', sourceEmb)
+				
+		
+		# Finally we're ready to generate emblem RDF via transform
+		fleNme = fqDestinationDirectory+'\\supplementary\\'+emblemId+'_rdf.json'
+		if EMBLEM_PROCESSES > 0 :
+			streamId = (bookFldr, emblemId) if getRdfStream() is not None else None
+			return emblemRdfPool().submit(emblemRdfJob, ET.tostring(emblem, with_tail=False), bookFldr, dateIssuedFromMods, picturaURL, emblemPageImageList, fleNme, streamId)
+		with timed('xsltEmblemRdf'):
+			result = emblem2Rdf(getTransforms()[2], emblemTree, bookFldr, dateIssuedFromMods, picturaURL, emblemPageImageList, fleNme)
+		streamRdf('emblem', bookFldr, emblemId, result)
+	return None
+
+# parse the spine or mods XML and enrich with valueURIs
+# Creates new folder structure for the book (emulates Medusa structure)
+# At end of this function we transform to get Medusa-json, rdf for book & rdf for emblems 
+def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirectory, progress=None): 
+	if progress is None:
+		progress = BookProgress(None, None, ())
+
+	# a resumed book picks up the enriched tree saved by its earlier run
+	copies = CopyBatch(fixityFile(destinationDirectory, fqDestinationDirectory))
+	tree = None
+	if progress.done('enrich'):
+		tree = loadEnrichedTree(destinationDirectory, fqDestinationDirectory)
+	if tree is not None:
+		nodes = BookNodes(tree.getroot())
+	else:
+		tree, nodes = enrichSpine(spine, destinationDirectory, fqDestinationDirectory, sourceDirectory, copies)
+		copies.wait()
+		progress.finish('enrich')
+	profileCheckpoint()
+
+	if not progress.done('book'):
+		transformBook(tree, destinationDirectory, fqDestinationDirectory)
+		progress.finish('book')
+
+#	Now we need to create rdf for each emblem
+#	Start by getting node list of all the emblems (if any) in the [spine] XML metadata file
+	if not progress.done('emblems'):
+		bookFldr = destinationDirectory
+		dateIssuedFromMods = emblemDateCreated(nodes)
+		jobs = []
+		for emblem in nodes.emblems:
+			job = processEmblem(emblem, bookFldr, dateIssuedFromMods, fqDestinationDirectory, sourceDirectory, copies)
+			if job is not None:
+				jobs.append(job)
+		profileCheckpoint()
+		waitEmblemJobs(jobs)
+		copies.wait()
+		progress.finish('emblems')
 	
 	return;
 
+# first stage of parseXML - save the original, relocate image urls, enrich the mods and save the enriched tree
+#	returns the tree and its BookNodes
+def enrichSpine(spine, destinationDirectory, fqDestinationDirectory, sourceDirectory, copies):
+	# instantiate root of retrieved XML content (spine) as an ET Element (root)
+    #   then instantiate an ET tree object from the root Element
+	root = ET.fromstring(spine)
+	tree1 = ET.ElementTree(root)
+	
+	# save the original mods or spine XML in supplementary folder
+	#    Use presence / absence of bibliosDesc and mods element to help determine file name
+	biblioDesc = next(root.iter(E_NS+'biblioDesc'), None)
+	mods = next(root.iter(M_NS+'mods'), None)
+	if biblioDesc is not None:
+		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_spine_orig.xml'
+		tree = ET.ElementTree(biblioDesc)
+	elif mods is not None :
+		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_mods_orig.xml'
+		tree = ET.ElementTree(mods)
+	else :
+		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_orig.xml'
+		tree = tree1
+	tree.write(fleNme)
+
+	# gather everything the rest of parseXML works on in a single walk of the tree
+	nodes = BookNodes(tree.getroot())
+	
+	# update (overwrite as necessary) the mods schema location and version number to mods 3.7
+	#    note need to specify mods schema location before setting spine schema location since spine schema imports mods 3.4, albeit using generic ver. 3 namespace URL
+	biblioD = nodes.biblioDescs
+	for bd in biblioD:
+		#print('hello')
+		bd.attrib[XSI_SCHEMA_LOCATION] = SPINE_SCHEMA_LOCATION
+
+	modsR =	nodes.mods
+	for mr in modsR:
+		mr.attrib[XSI_SCHEMA_LOCATION] = MODS_SCHEMA_LOCATION
+		mr.attrib['version'] = '3.7'
+
+	for emblem in nodes.emblemsWithHref() :
+		relocateEmblemHref(emblem)
+	for pictura in nodes.picturas :
+		relocatePictura(pictura, fqDestinationDirectory, sourceDirectory, copies)
+
+	enrichMods(nodes, destinationDirectory, fqDestinationDirectory)
+	writeEnrichedTree(tree, nodes, destinationDirectory, fqDestinationDirectory)
+	return tree, nodes
+
+# read back the enriched tree written by writeEnrichedTree, None if there is none
+def loadEnrichedTree(destinationDirectory, fqDestinationDirectory):
+	fleNme = enrichedTreeFile(destinationDirectory, fqDestinationDirectory)
+	if fleNme is None:
+		return None
+	return ET.parse(fleNme)
+
+# the enriched spine or mods saved by writeEnrichedTree, None when the book has not been enriched
+def enrichedTreeFile(destinationDirectory, fqDestinationDirectory):
+	for suffix in ('_spine.xml', '_mods.xml', '.xml'):
+		fleNme = fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+suffix
+		if os.path.isfile(fleNme):
+			return fleNme
+	return None
+
+# Raised by parseXMLStreaming when a spine is not laid out the way streaming needs; the book then goes through parseXML
+class StreamingUnsupported(Exception):
+	pass
+
+# Streaming version of parseXML for very large spines. The spine is read with iterparse from spineFile (a file name
+#	or binary file object) and only the book-level biblioDesc and MODS stay in memory: the MODS is enriched once when
+#	it has been read, then each e:emblem is handled as soon as it arrives (emblem XML, thumbnail and master copies,
+#	emblem RDF), appended to the original and enriched spine files and released.
+#	Needs a biblioDesc root whose MODS comes before its emblems, all of them direct children; other spines are handed to
+#	parseXML. The book-level json and RDF are transformed once the stream has finished, from what is then left in memory -
+#	the biblioDesc and its enriched MODS, which is all the book stylesheets read - so memory stays flat however many
+#	emblems the spine holds.
+def parseXMLStreaming(spineFile, destinationDirectory, fqDestinationDirectory, sourceDirectory, progress=None):
+	if progress is None:
+		progress = BookProgress(None, None, ())
+	try:
+		if progress.done('enrich'):
+			raise StreamingUnsupported('resuming after enrichment')
+		streamSpine(spineFile, destinationDirectory, fqDestinationDirectory, sourceDirectory)
+		# the spine files are only complete at the end of the stream, so every stage finishes together
+		progress.finish('enrich', 'book', 'emblems')
+	except StreamingUnsupported as e:
+		logging.info(destinationDirectory + ' not streamed, ' + str(e))
+		if isinstance(spineFile, str):
+			with open(spineFile, 'rb') as f:
+				spine = f.read()
+		else:
+			spineFile.seek(0)
+			spine = spineFile.read()
+		parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirectory, progress)
+
+def streamSpine(spineFile, destinationDirectory, fqDestinationDirectory, sourceDirectory):
+	bookFldr = destinationDirectory
+	jobs = []
+	copies = CopyBatch(fixityFile(destinationDirectory, fqDestinationDirectory))
+	biblioDesc = None
+	nodes = None
+	dateIssuedFromMods = None
+	# children of biblioDesc are written out one step late, once their tail text has been parsed
+	pending = None
+	with contextlib.ExitStack() as stack:
+		for event, el in ET.iterparse(spineFile, events=('start', 'end')):
+			if biblioDesc is None:
+				if event == 'start' and el.tag == E_NS+'biblioDesc':
+					if el.getparent() is not None:
+						raise StreamingUnsupported('biblioDesc is not the root')
+					biblioDesc = el
+					origFle = stack.enter_context(open(fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_spine_orig.xml', 'wb'))
+					enrichedFle = stack.enter_context(open(fqDestinationDirectory+'\\supplementary\\'+destinationDirectory+'_spine.xml', 'wb'))
+					origOut = StreamedSpineFile(stack, origFle, el.tag, dict(el.attrib), el.nsmap)
+					el.attrib[XSI_SCHEMA_LOCATION] = SPINE_SCHEMA_LOCATION
+					enrichedOut = StreamedSpineFile(stack, enrichedFle, el.tag, dict(el.attrib), dict(el.nsmap, xsi='http://www.w3.org/2001/XMLSchema-instance'))
+				elif el.tag == M_NS+'mods' or el.tag == E_NS+'emblem':
+					raise StreamingUnsupported('no biblioDesc around ' + el.tag)
+				continue
+
+			if event == 'start':
+				if el.getparent() is biblioDesc and pending is None and nodes is None:
+					origOut.write(biblioDesc.text or '')
+					enrichedOut.write(biblioDesc.text or '')
+				if el.tag == M_NS+'mods' and (el.getparent() is not biblioDesc or nodes is not None):
+					raise StreamingUnsupported('mods is not a single child of biblioDesc')
+				if el.tag == E_NS+'emblem' and (el.getparent() is not biblioDesc or nodes is None):
+					raise StreamingUnsupported('emblem outside biblioDesc or ahead of the mods')
+				continue
+
+			if el is not biblioDesc and el.getparent() is not biblioDesc:
+				continue
+			if pending is not None:
+				flushStreamedChild(pending, origOut, enrichedOut, biblioDesc)
+				pending = None
+			if el is biblioDesc:
+				break
+
+			orig = copy.deepcopy(el)
+			if el.tag == M_NS+'mods':
+				el.attrib[XSI_SCHEMA_LOCATION] = MODS_SCHEMA_LOCATION
+				el.attrib['version'] = '3.7'
+				nodes = BookNodes(el)
+				enrichMods(nodes, destinationDirectory, fqDestinationDirectory)
+				dateIssuedFromMods = emblemDateCreated(nodes)
+			elif el.tag == E_NS+'emblem':
+				if el.get(XLINK_HREF) is not None:
+					relocateEmblemHref(el)
+				for pictura in el.iterchildren(E_NS+'pictura'):
+					if pictura.get(XLINK_HREF) is not None:
+						relocatePictura(pictura, fqDestinationDirectory, sourceDirectory, copies)
+				job = processEmblem(el, bookFldr, dateIssuedFromMods, fqDestinationDirectory, sourceDirectory, copies)
+				if job is not None:
+					# serialized emblems wait in the pool's queue, so keep only a few per worker in flight
+					jobs.append(job)
+					waitEmblemJobs(jobs, EMBLEM_PROCESSES * 4)
+			pending = (orig, el)
+
+	if biblioDesc is None:
+		raise StreamingUnsupported('no biblioDesc')
+	if nodes is None:
+		raise StreamingUnsupported('no mods')
+	profileCheckpoint()
+	waitEmblemJobs(jobs)
+	copies.wait()
+	transformBook(biblioDesc.getroottree(), destinationDirectory, fqDestinationDirectory)
+
+# One of the spine files streamSpine writes - the root start tag, with its namespace declarations, goes through an
+#	incremental writer and each child of biblioDesc is then written as it is finished. lxml puts every namespace an
+#	element uses on that element's start tag, so the ones already declared on the root are taken out again, the way
+#	tree.write leaves them in parseXML's spine files
+class StreamedSpineFile:
+	def __init__(self, stack, fle, tag, attrib, nsmap):
+		self.fle = fle
+		self.out = stack.enter_context(ET.xmlfile(fle))
+		stack.enter_context(self.out.element(tag, attrib, nsmap=nsmap))
+		self.declarations = [(' xmlns:' + prefix if prefix else ' xmlns') + '="' + html.escape(uri) + '"' for prefix, uri in nsmap.items()]
+		self.declarations = [declaration.encode() for declaration in self.declarations]
+
+	# text between the children, escaped by the writer
+	def write(self, text):
+		self.out.write(text)
+
+	def writeChild(self, el):
+		xml = ET.tostring(el)
+		end = xml.index(b'>')
+		startTag = xml[:end]
+		for declaration in self.declarations:
+			startTag = startTag.replace(declaration, b'', 1)
+		self.out.flush()
+		self.fle.write(startTag + xml[end:])
+
+# write a finished child of biblioDesc, original and enriched, to the spine files; emblems are then released
+def flushStreamedChild(pending, origOut, enrichedOut, biblioDesc):
+	orig, el = pending
+	orig.tail = el.tail
+	origOut.writeChild(orig)
+	enrichedOut.writeChild(el)
+	if el.tag == E_NS+'emblem':
+		biblioDesc.remove(el)
+		el.clear()
+
+# Run manifest kept in MANIFEST_FILE - for each book url, its input hashes, the stages finished (with their time)
+#	and its status, running or complete. Rewritten whole after every change so an interrupted run loses nothing
+class RunManifest:
+	def __init__(self, fleNme):
+		self.fleNme = fleNme
+		self.lock = threading.Lock()
+		self.books = {}
+		if os.path.isfile(fleNme):
+			with open(fleNme, 'r') as fle:
+				self.books = json.load(fle).get('books', {})
+
+	# has the book finished every stage for these inputs
+	def complete(self, url, inputs):
+		with self.lock:
+			entry = self.books.get(url)
+			return entry is not None and entry.get('inputs') == inputs and entry.get('status') == 'complete'
+
+	# start or resume a book; returns the stages already finished for the same inputs
+	def begin(self, url, inputs):
+		with self.lock:
+			entry = self.books.get(url)
+			if entry is None or entry.get('inputs') != inputs:
+				entry = {'inputs' : inputs, 'stages' : {}, 'status' : 'running'}
+				self.books[url] = entry
+				self.save()
+			return set(entry['stages'])
+
+	def finish(self, url, stages):
+		with self.lock:
+			entry = self.books[url]
+			for stage in stages:
+				entry['stages'][stage] = datetime.datetime.now().isoformat(timespec='seconds')
+			if all(stage in entry['stages'] for stage in BOOK_STAGES):
+				entry['status'] = 'complete'
+			else:
+				entry['status'] = 'running'
+			self.save()
+
+	def save(self):
+		tmpNme = self.fleNme + '.tmp'
+		with open(tmpNme, 'w') as fle:
+			json.dump({'version' : 1, 'books' : self.books}, fle, indent=1)
+		os.replace(tmpNme, self.fleNme)
+
+runManifest = None
+runManifestLock = threading.Lock()
+xslHashes = None
+
+def getRunManifest():
+	global runManifest
+	if MANIFEST_FILE is None:
+		return None
+	if runManifest is None:
+		with runManifestLock:
+			if runManifest is None:
+				runManifest = RunManifest(MANIFEST_FILE)
+	return runManifest
+
+# the inputs a book's outputs depend on - its spine, the three xsl files and the enrichment version
+def bookInputs(spineHash):
+	global xslHashes
+	if xslHashes is None:
+		hashes = {}
+		for xslFile in XSL_FILES:
+			with open(xslFile, 'rb') as f:
+				hashes[xslFile] = hashlib.sha256(f.read()).hexdigest()
+		xslHashes = hashes
+	return {'spine' : spineHash, 'xsl' : xslHashes, 'enrichment' : ENRICHMENT_VERSION}
+
+# a book's progress through BOOK_STAGES, recorded in the run manifest (when there is one)
+class BookProgress:
+	def __init__(self, manifest, url, doneStages):
+		self.manifest = manifest
+		self.url = url
+		self.doneStages = set(doneStages)
+
+	def done(self, stage):
+		return stage in self.doneStages
+
+	def finish(self, *stages):
+		self.doneStages.update(stages)
+		if self.manifest is not None:
+			self.manifest.finish(self.url, stages)
+
+# Load bulk authority downloads into the local authority index (LOCAL_AUTHORITY_INDEX)
+#	*.nt / *.nt.gz - MADS/RDF or SKOS N-Triples from id.loc.gov/download (subjects, names, genreForms, geographicAreas,
+#		relators, countries); each record's scheme is taken from its URI and it is indexed under its authoritativeLabel /
+#		prefLabel, with the /<scheme>/<id>.html path the id.loc.gov search page links to
+#	anything else - a VIAF cluster extract, one heading per line as viafid<TAB>nametype<TAB>heading, nametype as
+#		AutoSuggest gives it (personal, corporate, ...); viafid may be the full cluster URI
+#	a scheme found in the files replaces what the index held for it before
+NT_LABEL = re.compile(r'^<http://id\.loc\.gov(/[^>]+)/([^/>]+)> <(?:http://www\.loc\.gov/mads/rdf/v1#authoritativeLabel|http://www\.w3\.org/2004/02/skos/core#prefLabel)> "((?:[^"\\]|\\.)*)"')
+NT_ESCAPE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+NT_ESCAPES = {'t' : '\t', 'n' : '\n', 'r' : '\r', 'b' : '\b', 'f' : '\f'}
+
+def ntUnescape(text):
+	def unescape(m):
+		escape = m.group(1)
+		if len(escape) > 1:
+			return chr(int(escape[1:], 16))
+		return NT_ESCAPES.get(escape, escape)
+	return NT_ESCAPE.sub(unescape, text)
+
+def authorityRecords(fleNme):
+	opener = gzip.open if fleNme.endswith('.gz') else open
+	with opener(fleNme, 'rt', encoding='utf-8') as fle:
+		if fleNme.endswith('.nt') or fleNme.endswith('.nt.gz'):
+			for line in fle:
+				m = NT_LABEL.match(line)
+				if m is not None:
+					scheme = m.group(1)
+					yield scheme, scheme + '/' + m.group(2) + '.html', ntUnescape(m.group(3)), None
+		else:
+			for line in fle:
+				fields = line.rstrip('\r\n').split('\t')
+				if len(fields) == 3 and len(fields[2]) > 0:
+					yield 'viaf', fields[0].rstrip('/').rsplit('/', 1)[-1], fields[2], fields[1].lower()
+
+def importAuthorities(fleNmes):
+	index = LocalAuthorityIndex(LOCAL_AUTHORITY_INDEX)
+	replaced = set()
+	for fleNme in fleNmes:
+		counts = {}
+		batch = []
+		for scheme, uri, label, nametype in authorityRecords(fleNme):
+			if scheme not in replaced:
+				index.conn.execute('DELETE FROM labels WHERE scheme = ?', (scheme,))
+				index.conn.execute('DELETE FROM imports WHERE scheme = ?', (scheme,))
+				replaced.add(scheme)
+			counts[scheme] = counts.get(scheme, 0) + 1
+			batch.append((scheme, authorityKey(label), uri, label, nametype))
+			if len(batch) >= 10000:
+				index.conn.executemany('INSERT INTO labels VALUES (?, ?, ?, ?, ?)', batch)
+				batch = []
+		index.conn.executemany('INSERT INTO labels VALUES (?, ?, ?, ?, ?)', batch)
+		for scheme, count in counts.items():
+			index.conn.execute('INSERT INTO imports VALUES (?, ?, ?, ?)', (scheme, fleNme, count, datetime.datetime.now().isoformat(timespec='seconds')))
+			print(fleNme + ': ' + str(count) + ' labels for ' + scheme)
+		index.conn.commit()
+	index.rebuild()
+	index.conn.commit()
+	index.close()
+
 # iterate through the urls 
 # build folder structure 
 # enrich mods / spine book descriptions with urls (viaf, id.loc.gov, iconclass)
@@ -625,23 +2724,186 @@ def parseXML(spine, destinationDirectory, fqDestinationDirectory, sourceDirector
 # run appropriate xsl to create rdf and medusa-like metadata
 # save metadata and rdf
 
-with open('myList20Oct.json', 'r') as fle:
-	myList = json.load(fle)
-	
-myUrls = myList['urlList']
-dirPrefix = "E:\\emblemimages-wwwroot\\"
-	
-for eachUrl in myUrls :
-	print(eachUrl)
-	
+# the folder name of the book a spine url belongs to
+def bookDirName(eachUrl):
 	if eachUrl.find('HABVols') == -1 :
-		dirNme = eachUrl.split("/")[-1].split(".xml")[0]
+		return eachUrl.split("/")[-1].split(".xml")[0]
 	else :
-		dirNme = eachUrl.split("/")[-2]
+		return eachUrl.split("/")[-2]
+
+# A downloaded spine - its bytes, a temporary file holding it (STREAM_EMBLEMS) or, when it came through the
+#	spine cache, its cached file at path - with the sha256 hex digest and size of its content
+class FetchedSpine:
+	def __init__(self, spine, sha256, size, path=None):
+		self.spine = spine
+		self.sha256 = sha256
+		self.size = size
+		self.path = path
+
+	# the spine as processSpine takes it - bytes, or an open file with STREAM_EMBLEMS; files are closed by the stack
+	def open(self, stack):
+		if self.path is not None :
+			if STREAM_EMBLEMS :
+				return stack.enter_context(open(self.path, 'rb'))
+			with open(self.path, 'rb') as f:
+				return f.read()
+		if not isinstance(self.spine, bytes) :
+			stack.enter_context(self.spine)
+		return self.spine
+
+# On-disk spine cache - <sha256 of url>.xml holds the spine and <sha256 of url>.json the url, ETag, Last-Modified,
+#	sha256 and size it was downloaded with. A cached spine is revalidated with a conditional GET on every fetch, so a
+#	304 costs one round trip and no download; a changed spine replaces the cached copy
+class SpineCache:
+	def __init__(self, folder):
+		self.folder = folder
+		os.makedirs(folder, exist_ok=True)
+
+	def fetch(self, url):
+		key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+		spinePath = os.path.join(self.folder, key + '.xml')
+		metaPath = os.path.join(self.folder, key + '.json')
+		meta = None
+		if os.path.isfile(spinePath) and os.path.isfile(metaPath) :
+			with open(metaPath, 'r') as f:
+				meta = json.load(f)
+		headers = {}
+		if meta is not None :
+			if meta.get('etag') is not None :
+				headers['If-None-Match'] = meta['etag']
+			if meta.get('lastModified') is not None :
+				headers['If-Modified-Since'] = meta['lastModified']
+		resp = httpGet(url, headers=headers, stream=True)
+		if resp.status_code == 304 and meta is not None :
+			resp.close()
+			countMetric('spineNotModified')
+			return FetchedSpine(None, meta['sha256'], meta['size'], spinePath)
+		if resp.status_code != 200 :
+			# not a spine - hand it on uncached, as it came
+			content = resp.content
+			return FetchedSpine(content, hashlib.sha256(content).hexdigest(), len(content))
+
+		tmpNme = spinePath + '.' + uuid.uuid4().hex + '.tmp'
+		spineHash = hashlib.sha256()
+		spineSize = 0
+		with open(tmpNme, 'wb') as f:
+			for chunk in resp.iter_content(1024*1024):
+				f.write(chunk)
+				spineHash.update(chunk)
+				spineSize += len(chunk)
+		os.replace(tmpNme, spinePath)
+		meta = {'url' : url, 'etag' : resp.headers.get('ETag'), 'lastModified' : resp.headers.get('Last-Modified'), 'sha256' : spineHash.hexdigest(), 'size' : spineSize, 'fetched' : datetime.datetime.now().isoformat(timespec='seconds')}
+		with open(metaPath + '.tmp', 'w') as f:
+			json.dump(meta, f)
+		os.replace(metaPath + '.tmp', metaPath)
+		countMetric('spineDownloads')
+		return FetchedSpine(None, meta['sha256'], spineSize, spinePath)
+
+spineCache = None
+spineCacheLock = threading.Lock()
+
+def getSpineCache():
+	global spineCache
+	if SPINE_CACHE_DIR is None:
+		return None
+	if spineCache is None:
+		with spineCacheLock:
+			if spineCache is None:
+				spineCache = SpineCache(SPINE_CACHE_DIR)
+	return spineCache
+
+# download a spine - through the spine cache when there is one
+def fetchSpine(eachUrl):
+	with timed('spineFetch'):
+		cache = getSpineCache()
+		if cache is not None :
+			fetched = cache.fetch(eachUrl)
+		elif STREAM_EMBLEMS :
+			# spool the spine to a temporary file rather than holding it in memory
+			spine = tempfile.TemporaryFile()
+			spineHash = hashlib.sha256()
+			spineSize = 0
+			resp = httpGet(eachUrl, stream=True)
+			for chunk in resp.iter_content(1024*1024):
+				spine.write(chunk)
+				spineHash.update(chunk)
+				spineSize += len(chunk)
+			spine.seek(0)
+			fetched = FetchedSpine(spine, spineHash.hexdigest(), spineSize)
+		else :
+			resp = httpGet(eachUrl)
+			fetched = FetchedSpine(resp.content, hashlib.sha256(resp.content).hexdigest(), len(resp.content))
+	countMetric('spineBytes', fetched.size)
+	return fetched
+
+# Download the spines of myUrls ahead of their books on PREFETCH_WORKERS threads. Yields (url, fetched) as spines
+#	arrive, fetched being the FetchedSpine or the exception its download raised; at most PREFETCH_DEPTH wait to be
+#	taken. With PREFETCH_DEPTH 0 yields (url, None) for each url in turn and processBook fetches the spine itself
+def prefetchSpines(myUrls):
+	if PREFETCH_DEPTH <= 0 :
+		for eachUrl in myUrls :
+			yield eachUrl, None
+		return
+	fetchedSpines = queue.Queue(maxsize=PREFETCH_DEPTH)
+	pending = iter(myUrls)
+	pendingLock = threading.Lock()
+
+	def prefetch():
+		while True:
+			with pendingLock:
+				eachUrl = next(pending, None)
+			if eachUrl is None:
+				fetchedSpines.put(None)
+				return
+			token = currentBook.set(bookDirName(eachUrl))
+			try:
+				fetched = fetchSpine(eachUrl)
+			except Exception as e:
+				fetched = e
+			finally:
+				currentBook.reset(token)
+			fetchedSpines.put((eachUrl, fetched))
+
+	workers = max(1, PREFETCH_WORKERS)
+	for i in range(workers):
+		threading.Thread(target=prefetch, name='spinePrefetch' + str(i), daemon=True).start()
+	while workers > 0:
+		item = fetchedSpines.get()
+		if item is None:
+			workers -= 1
+		else:
+			yield item
+
+# process a single book from the url list - build its folder structure, copy the marc record,
+#	fetch the spine (unless it was prefetched) and hand it to parseXML
+def processBook(eachUrl, fetched=None):
+	print(eachUrl)
+	
+	dirNme = bookDirName(eachUrl)
 		
 	fqDirNme = dirPrefix+dirNme	
 	print (fqDirNme)
-	
+
+	with bookMetrics(dirNme), contextlib.ExitStack() as stack:
+		if isinstance(fetched, Exception) :
+			raise fetched
+		if fetched is None :
+			fetched = fetchSpine(eachUrl)
+		spine = fetched.open(stack)
+
+		manifest = getRunManifest()
+		if manifest is not None :
+			progress = BookProgress(manifest, eachUrl, manifest.begin(eachUrl, bookInputs(fetched.sha256)))
+			if all(progress.done(stage) for stage in BOOK_STAGES) and os.path.isdir(fqDirNme) :
+				print('unchanged since the last run, skipped')
+				return
+		else :
+			progress = BookProgress(None, None, ())
+
+		processSpine(spine, dirNme, fqDirNme, progress)
+
+# create the book's folders, copy its marc record and run the spine through parseXML (or parseXMLStreaming)
+def processSpine(spine, dirNme, fqDirNme, progress):
 	if not os.path.isdir(fqDirNme) : 
 		os.mkdir(fqDirNme)
 	if not os.path.isdir(fqDirNme+'\supplementary') : 
@@ -658,22 +2920,551 @@ for eachUrl in myUrls :
 		os.mkdir(fqDirNme+'\\_access\\emblem') 
 	
 
-	fileSource = oldPaths.get(dirNme)
+	fileSource = getOldPaths().get(dirNme)
 
 	
-	marcDst = fqDirNme + "\\emblematica\\" + dirNme + "_marc.xml"
-	marcFile = fileSource + "\\" + dirNme + "_marc.xml"
-	if os.path.exists(marcFile) and os.path.isfile(marcFile) :
-		shutil.copy2( marcFile, marcDst )
-		
-	marcFile = fileSource + "\\" + dirNme + "-MARC.xml"
-	if os.path.exists(marcFile) and os.path.isfile(marcFile) :
-		shutil.copy2( marcFile, marcDst )
+	if not progress.done('marc') :
+		marcDst = fqDirNme + "\\emblematica\\" + dirNme + "_marc.xml"
+		sourceIndex = getSourceIndex(fileSource)
+		marcFile = fileSource + "\\" + dirNme + "_marc.xml"
+		if sourceIndex.has('', dirNme + "_marc.xml") :
+			shutil.copy2( marcFile, marcDst )
+			
+		marcFile = fileSource + "\\" + dirNme + "-MARC.xml"
+		if sourceIndex.has('', dirNme + "-MARC.xml") :
+			shutil.copy2( marcFile, marcDst )
+		progress.finish('marc')
 	
-	resp = requests.get(eachUrl)
-	spine = resp.content
+	with profiledBook(dirNme, fqDirNme):
+		if STREAM_EMBLEMS :
+			parseXMLStreaming(spine, dirNme, fqDirNme, fileSource, progress)
+		else :
+			parseXML(spine, dirNme, fqDirNme, fileSource, progress)
+
+bookPool = None
+bookPoolLock = threading.Lock()
+
+# the book worker threads - one pool for the life of the process, so a long-running worker keeps their compiled XSLTs
+def getBookPool():
+	global bookPool
+	if bookPool is None:
+		with bookPoolLock:
+			if bookPool is None:
+				bookPool = concurrent.futures.ThreadPoolExecutor(max_workers=BOOK_WORKERS, thread_name_prefix='book')
+	return bookPool
+
+# process every book in the list, BOOK_WORKERS at a time
+#	each book writes its files only to its own folder; its enrichment results go to the shared results sink, which
+#	batches the rows of every worker, and its json-ld to the rdf stream when that is on - beyond those two sinks,
+#	books share only the authority cache
+#	a book that fails is logged and reported at the end; the rest of the list carries on
+#	returns (failedUrls, retryUrls) - retryUrls are the books stopped by an unavailable service
+def processBooks(myUrls):
+	failedUrls = []
+	retryUrls = []
+	if BOOK_WORKERS <= 1 :
+		for eachUrl, fetched in prefetchSpines(myUrls) :
+			try:
+				processBook(eachUrl, fetched)
+			except ServiceUnavailable as e:
+				logging.warning('Book marked for retry: ' + eachUrl + ' (' + str(e) + ')')
+				retryUrls.append(eachUrl)
+			except Exception:
+				logging.exception('Book failed: ' + eachUrl)
+				failedUrls.append(eachUrl)
+	else :
+		# take the next prefetched spine only when a worker is free, so the prefetch queue stays bounded
+		workerSlots = threading.BoundedSemaphore(BOOK_WORKERS)
+		pool = getBookPool()
+		futures = {}
+		for eachUrl, fetched in prefetchSpines(myUrls) :
+			workerSlots.acquire()
+			future = pool.submit(processBook, eachUrl, fetched)
+			future.add_done_callback(lambda f: workerSlots.release())
+			futures[future] = eachUrl
+		for future in concurrent.futures.as_completed(futures):
+			try:
+				future.result()
+			except ServiceUnavailable as e:
+				logging.warning('Book marked for retry: ' + futures[future] + ' (' + str(e) + ')')
+				retryUrls.append(futures[future])
+			except Exception:
+				logging.exception('Book failed: ' + futures[future])
+				failedUrls.append(futures[future])
+	return failedUrls, retryUrls
+
+# the urls of a url list - json as myList20Oct.json ({"urlList" : [...]}) or text with one url per line
+def readUrlList(fleNme):
+	if fleNme.endswith('.json') :
+		with open(fleNme, 'r') as fle:
+			return json.load(fle)['urlList']
+	with open(fleNme, 'r') as fle:
+		return [line.strip() for line in fle if line.strip() and not line.startswith('#')]
+
+# the authority queries of a spine - its mods are collected as iterparse reaches them and the emblems cleared, so a
+#	large spine is never held whole
+def spineQueries(spine):
+	queries = []
+	source = io.BytesIO(spine) if isinstance(spine, bytes) else spine
+	for event, el in ET.iterparse(source, events=('end',), tag=(M_NS+'mods', E_NS+'emblem')):
+		if el.tag == M_NS+'mods':
+			queries.extend(collectAuthorityQueries(BookNodes(el)))
+		el.clear()
+	return queries
+
+# Warm-up pass - fetch and parse every spine of the list, collect the distinct authority queries across all of them and
+#	resolve them into the authority cache (and the name memo), so the books that follow find every answer there.
+#	Books the run manifest has as complete for the same spine are left out. Prints the number of lookups the list needs
+def warmUp(myUrls):
+	if not CACHE_ENABLED:
+		print('warm-up skipped - it needs the authority cache (CACHE_ENABLED)')
+		return
+	with timed('warmUp'):
+		start = time.perf_counter()
+		manifest = getRunManifest()
+		queries = {}
+		bookQueries = 0
+		books = 0
+		for eachUrl, fetched in prefetchSpines(myUrls):
+			try:
+				if fetched is None:
+					fetched = fetchSpine(eachUrl)
+				elif isinstance(fetched, Exception):
+					raise fetched
+				if manifest is not None and manifest.complete(eachUrl, bookInputs(fetched.sha256)):
+					continue
+				with contextlib.ExitStack() as stack:
+					found = spineQueries(fetched.open(stack))
+			except Exception as e:
+				# left for the book itself to fail on
+				logging.warning('Warm-up could not read ' + eachUrl + ' (' + str(e) + ')')
+				continue
+			books += 1
+			bookQueries += len(found)
+			for url, expectJSON in found:
+				queries.setdefault(url, expectJSON)
+
+		schemes = {}
+		for url in queries:
+			search = authoritySearch(url)
+			scheme = search[0] if search is not None else 'other'
+			schemes[scheme] = schemes.get(scheme, 0) + 1
+		print('warm-up: ' + str(books) + ' books need ' + str(len(queries)) + ' distinct authority lookups (' + str(bookQueries) + ' counted book by book) - '
+			+ ', '.join(scheme + ' ' + str(count) for scheme, count in sorted(schemes.items())))
+		countMetric('warmUpQueries', len(queries))
+		resolved = resolveQueries(list(queries.items()), WARM_UP_WORKERS)
+		print('warm-up: ' + str(len(resolved)) + ' resolved in ' + str(round(time.perf_counter() - start, 1)) + ' s')
+
+# process a list of books and report the ones that failed
+def runBooks(myUrls):
+	if WARM_UP and len(myUrls) > 1 :
+		warmUp(myUrls)
+	failedUrls, retryUrls = processBooks(myUrls)
+	if len(failedUrls) > 0 :
+		print(str(len(failedUrls)) + ' of ' + str(len(myUrls)) + ' books failed:')
+		for eachUrl in failedUrls :
+			print(eachUrl)
+	if len(retryUrls) > 0 :
+		print(str(len(retryUrls)) + ' of ' + str(len(myUrls)) + ' books need a retry')
+	return failedUrls, retryUrls
+
+# write what the run has gathered so far - enrichment results, the rdf stream, missing images and metrics - and forget
+#	the run's name memo, missing images and source listings, so the next run or job starts afresh
+def flushRun():
+	global missingImagesStarted
+	nameMemo.clear()
+	clearSourceIndexes()
+	if resultsSink is not None :
+		resultsSink.flush()
+	if rdfStream is not None :
+		rdfStream.flush()
+	if len(missingImages) > 0 :
+		print(str(len(missingImages)) + ' emblem images not found in their book\'s source, listed in ' + MISSING_IMAGES_FILE)
+		with missingImagesLock:
+			rows = list(missingImages)
+			del missingImages[:]
+		with open(MISSING_IMAGES_FILE, 'a' if missingImagesStarted else 'w', newline='') as fle:
+			missingWriter = csv.writer(fle)
+			if not missingImagesStarted :
+				missingWriter.writerow(['bookId', 'emblemId', 'image', 'expectedPath'])
+			missingWriter.writerows(rows)
+		missingImagesStarted = True
+	if len(bookProfiles) > 0 :
+		writeProfileRanking(PROFILE_RANKING_FILE)
+		print('profiled books ranked in ' + PROFILE_RANKING_FILE)
+	if metrics is not None :
+		metrics.write(METRICS_FILE, METRICS_PROM_FILE)
+		print('metrics written to ' + METRICS_FILE + ' and ' + METRICS_PROM_FILE)
+
+# end of the run - stop the worker pools, print their reports and close the caches and the results sink
+#	(flushRun has written the rest)
+def finishRun():
+	if bookPool is not None :
+		bookPool.shutdown()
+	if emblemPool is not None :
+		emblemPool.shutdown()
+	if copyPool is not None :
+		copyPool.shutdown()
+		print(copyReport())
+	if authorityCache is not None :
+		print(authorityCache.report())
+		authorityCache.close()
+	if localAuthorityIndex is not None :
+		localAuthorityIndex.close()
+	if resultsSink is not None :
+		resultsSink.close()
+		print(str(resultsSink.written) + ' enrichment results recorded')
+		if resultsSink.dropped > 0 :
+			print(str(resultsSink.dropped) + ' enrichment results could not be written and were dropped - see the log')
+	if rdfStream is not None :
+		rdfStream.close()
+		print(str(rdfStream.documents) + ' json-ld documents streamed to ' + RDF_STREAM_FILE + '-*')
+
+# Watch mode - one long-running process keeps its compiled XSLTs, HTTP pools, caches and book workers between jobs.
+#	Url lists (*.json or *.txt, see readUrlList) dropped into queueDir are taken in name order; write a list elsewhere
+#	and move it in, so it is never read half written. While its books run a list sits in queueDir\processing, then it
+#	is moved to queueDir\done; the urls that failed or need a retry go to queueDir\failed\<list>.json, ready to be
+#	dropped back in. Restart the worker after changing the XSL files
+def watchQueue(queueDir, interval):
+	for folder in ('processing', 'done', 'failed'):
+		os.makedirs(os.path.join(queueDir, folder), exist_ok=True)
+	print('watching ' + queueDir + ' for url lists')
+	while True:
+		with os.scandir(queueDir) as entries:
+			jobs = sorted(entry.name for entry in entries if entry.is_file() and (entry.name.endswith('.json') or entry.name.endswith('.txt')))
+		if len(jobs) == 0:
+			time.sleep(interval)
+			continue
+		for job in jobs:
+			processing = os.path.join(queueDir, 'processing', job)
+			try:
+				os.replace(os.path.join(queueDir, job), processing)
+			except OSError:
+				# taken by another worker
+				continue
+			print('job ' + job)
+			try:
+				myUrls = readUrlList(processing)
+			except (OSError, ValueError, KeyError) as e:
+				logging.error('Unreadable url list ' + job + ' (' + str(e) + ')')
+				os.replace(processing, os.path.join(queueDir, 'failed', job))
+				continue
+			failedUrls, retryUrls = runBooks(myUrls)
+			flushRun()
+			if len(failedUrls) + len(retryUrls) > 0 :
+				with open(os.path.join(queueDir, 'failed', os.path.splitext(job)[0] + '.json'), 'w') as fle:
+					json.dump({'urlList' : failedUrls + retryUrls}, fle, indent=1)
+			os.replace(processing, os.path.join(queueDir, 'done', job))
+
+# Watch mode on stdin - each line is a book url, processed as soon as it is read, until end of input
+def watchStdin():
+	for line in sys.stdin:
+		eachUrl = line.strip()
+		if eachUrl :
+			runBooks([eachUrl])
+			flushRun()
+
+# Durable job queue - one row per book with its status (pending, leased, done or failed), attempts, the worker holding
+#	or last holding it, its lease expiry and last error. Every change is one transaction on the shared file
+class JobQueue:
+	def __init__(self, fleNme):
+		self.lock = threading.Lock()
+		self.worker = socket.gethostname() + ':' + str(os.getpid())
+		self.conn = sqlite3.connect(fleNme, timeout=60, isolation_level=None, check_same_thread=False)
+		self.conn.execute('CREATE TABLE IF NOT EXISTS jobs (url TEXT PRIMARY KEY, status TEXT, attempts INTEGER, worker TEXT, leaseUntil REAL, lastError TEXT, added REAL, updated REAL)')
+		self.conn.execute('CREATE INDEX IF NOT EXISTS jobsByStatus ON jobs (status)')
+
+	# queue books not queued before; returns how many were added
+	def add(self, urls):
+		now = time.time()
+		with self.lock:
+			before = self.conn.total_changes
+			self.conn.execute('BEGIN IMMEDIATE')
+			self.conn.executemany("INSERT OR IGNORE INTO jobs (url, status, attempts, added, updated) VALUES (?, 'pending', 0, ?, ?)", [(url, now, now) for url in urls])
+			self.conn.execute('COMMIT')
+			return self.conn.total_changes - before
+
+	# put failed books back in the queue with their attempts reset
+	def retryFailed(self):
+		with self.lock:
+			return self.conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, lastError = NULL, updated = ? WHERE status = 'failed'", (time.time(),)).rowcount
+
+	# lease the next book - pending, or leased under a lease that has run out - and return its url, None when there is none.
+	#	An expired lease whose book has used up its attempts is marked failed instead
+	def claim(self):
+		now = time.time()
+		with self.lock:
+			self.conn.execute('BEGIN IMMEDIATE')
+			try:
+				self.conn.execute("UPDATE jobs SET status = 'failed', lastError = 'lease expired after ' || attempts || ' attempts', updated = ? WHERE status = 'leased' AND leaseUntil < ? AND attempts >= ?", (now, now, JOB_MAX_ATTEMPTS))
+				row = self.conn.execute("SELECT url FROM jobs WHERE status = 'pending' OR (status = 'leased' AND leaseUntil < ?) ORDER BY rowid LIMIT 1", (now,)).fetchone()
+				if row is not None:
+					self.conn.execute("UPDATE jobs SET status = 'leased', worker = ?, leaseUntil = ?, attempts = attempts + 1, updated = ? WHERE url = ?", (self.worker, now + JOB_LEASE, now, row[0]))
+				self.conn.execute('COMMIT')
+			except BaseException:
+				self.conn.execute('ROLLBACK')
+				raise
+		return row[0] if row is not None else None
+
+	# renew the leases this worker holds
+	def heartbeat(self):
+		with self.lock:
+			return self.conn.execute("UPDATE jobs SET leaseUntil = ? WHERE worker = ? AND status = 'leased'", (time.time() + JOB_LEASE, self.worker)).rowcount
+
+	# record a book's outcome - done, or with an error back to pending for another attempt, failed once its attempts are
+	#	used up. Returns False when the lease had been taken over by another worker
+	def finish(self, url, error=None):
+		now = time.time()
+		with self.lock:
+			if error is None:
+				cursor = self.conn.execute("UPDATE jobs SET status = 'done', lastError = NULL, updated = ? WHERE url = ? AND worker = ? AND status = 'leased'", (now, url, self.worker))
+			else:
+				cursor = self.conn.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, lastError = ?, updated = ? WHERE url = ? AND worker = ? AND status = 'leased'", (JOB_MAX_ATTEMPTS, error, now, url, self.worker))
+		return cursor.rowcount == 1
+
+	# books still to do that this worker cannot take now - pending ones aside, those leased by other workers
+	def waiting(self):
+		with self.lock:
+			return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending' OR (status = 'leased' AND worker != ?)", (self.worker,)).fetchone()[0]
+
+	def counts(self):
+		with self.lock:
+			return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+	def failed(self):
+		with self.lock:
+			return self.conn.execute("SELECT url, attempts, lastError FROM jobs WHERE status = 'failed' ORDER BY rowid").fetchall()
+
+	def close(self):
+		self.conn.close()
+
+# Work on the books of a job queue until it is drained - BOOK_WORKERS loops each leasing a book, processing it and
+#	recording the outcome, with a heartbeat thread renewing this worker's leases meanwhile
+def workJobs(jobQueue):
+	stop = threading.Event()
+	def heartbeat():
+		while not stop.wait(JOB_HEARTBEAT):
+			jobQueue.heartbeat()
+
+	def work():
+		processed = 0
+		while True:
+			eachUrl = jobQueue.claim()
+			if eachUrl is None:
+				if jobQueue.waiting() == 0:
+					return processed
+				time.sleep(JOB_POLL)
+				continue
+			error = None
+			try:
+				processBook(eachUrl)
+			except ServiceUnavailable as e:
+				logging.warning('Book marked for retry: ' + eachUrl + ' (' + str(e) + ')')
+				error = 'service unavailable: ' + str(e)
+			except Exception as e:
+				logging.exception('Book failed: ' + eachUrl)
+				error = type(e).__name__ + ': ' + str(e)
+			if not jobQueue.finish(eachUrl, error):
+				logging.warning('Lease on ' + eachUrl + ' was taken over by another worker before it finished')
+			# each job is one book - its source listing is not kept for the rest of the run
+			clearSourceIndexes()
+			processed += 1
+
+	threading.Thread(target=heartbeat, name='jobHeartbeat', daemon=True).start()
+	try:
+		if BOOK_WORKERS <= 1 :
+			processed = work()
+		else :
+			loops = [getBookPool().submit(work) for i in range(BOOK_WORKERS)]
+			processed = sum(loop.result() for loop in loops)
+	finally:
+		stop.set()
+	print(jobQueue.worker + ' processed ' + str(processed) + ' books')
+
+def jobsStatus(jobQueue):
+	counts = jobQueue.counts()
+	print(', '.join(status + ' ' + str(counts.get(status, 0)) for status in ('pending', 'leased', 'done', 'failed')))
+	for eachUrl, attempts, lastError in jobQueue.failed():
+		print(eachUrl + ' - ' + str(attempts) + ' attempts - ' + str(lastError))
+
+# Re-render - regenerate a book's json and json-ld from the enriched xml its last run saved in supplementary, with no
+#	downloads, lookups or copies. An output is redone only when it is older than the enriched xml or its own xsl,
+#	so a fix to one stylesheet reruns just that transform. Runs in a render worker process, so the output root and whether
+#	the rdf stream is on are passed in - returns (outputs rendered, outputs up to date, [(kind, docId, json-ld)] to stream)
+def renderBook(dirNme, prefix, stream):
+	fqDirNme = prefix + dirNme
+	enrichedFile = enrichedTreeFile(dirNme, fqDirNme)
+	if enrichedFile is None :
+		raise FileNotFoundError('no enriched spine or mods in ' + fqDirNme + '\\supplementary')
+	enrichedTime = os.stat(enrichedFile).st_mtime
+	bookJsonTime, bookRdfTime, emblemRdfTime = [max(enrichedTime, os.stat(xslFile).st_mtime) for xslFile in XSL_FILES]
+	transform, transformMods2Rdf, transformEmblem2Rdf = getTransforms()
+	tree = ET.parse(enrichedFile)
+	rendered = 0
+	current = 0
+	streamed = []
+
+	fleNme = fqDirNme+'\\'+dirNme+'.json'
+	if outdated(fleNme, bookJsonTime) :
+		result = transform(tree)
+		with open(fleNme, 'wb') as f:
+			f.write(result)
+		rendered += 1
+	else :
+		current += 1
+
+	fleNme = fqDirNme+'\\supplementary\\'+dirNme+'_rdf.json'
+	if outdated(fleNme, bookRdfTime) :
+		result = transformMods2Rdf(tree, docName=ET.XSLT.strparam(dirNme))
+		with open(fleNme, 'wb') as f:
+			f.write(result)
+		if stream :
+			streamed.append(('book', dirNme, bytes(result)))
+		rendered += 1
+	else :
+		current += 1
+
+	nodes = BookNodes(tree.getroot())
+	dateIssuedFromMods = emblemDateCreated(nodes)
+	for emblem in nodes.emblems:
+		emblemId = XP_EMBLEM_ID(emblem)
+		if len(emblemId) == 0 :
+			continue
+		fleNme = fqDirNme+'\\supplementary\\'+emblemId+'_rdf.json'
+		if not outdated(fleNme, emblemRdfTime) :
+			current += 1
+			continue
+		result = emblem2Rdf(transformEmblem2Rdf, ET.ElementTree(emblem), dirNme, dateIssuedFromMods, XP_EMBLEM_PICTURA_HREF(emblem), pageImageList(XP_EMBLEM_HREF(emblem)), fleNme)
+		if stream :
+			streamed.append(('emblem', emblemId, result))
+		rendered += 1
+	return rendered, current, streamed
+
+# True when fleNme is missing or older than since - an output written in the same tick as its enriched xml (coarse
+#	file system timestamps) counts as up to date
+def outdated(fleNme, since):
+	try:
+		return os.stat(fleNme).st_mtime < since
+	except FileNotFoundError:
+		return True
+
+# every book folder under the output root that has a supplementary folder
+def outputBooks():
+	return sorted(dirNme for dirNme in os.listdir(dirPrefix) if os.path.isdir(dirPrefix + dirNme + '\\supplementary'))
+
+# re-render books across RENDER_PROCESSES worker processes - returns the books that failed
+def renderBooks(books, processes=None):
+	failedBooks = []
+	rendered = 0
+	current = 0
+	stream = getRdfStream() is not None
+	with timed('render'), concurrent.futures.ProcessPoolExecutor(processes or RENDER_PROCESSES or os.cpu_count()) as pool:
+		futures = {pool.submit(renderBook, dirNme, dirPrefix, stream) : dirNme for dirNme in books}
+		for future in concurrent.futures.as_completed(futures):
+			dirNme = futures[future]
+			try:
+				bookRendered, bookCurrent, streamed = future.result()
+			except Exception:
+				logging.exception('Render failed: ' + dirNme)
+				failedBooks.append(dirNme)
+				continue
+			for kind, docId, result in streamed:
+				streamRdf(kind, dirNme, docId, result)
+			print(dirNme + ' - ' + str(bookRendered) + ' rendered, ' + str(bookCurrent) + ' up to date')
+			rendered += bookRendered
+			current += bookCurrent
+	countMetric('renderedFiles', rendered)
+	print(str(len(books)) + ' books re-rendered - ' + str(rendered) + ' files rendered, ' + str(current) + ' up to date')
+	if len(failedBooks) > 0 :
+		print(str(len(failedBooks)) + ' of ' + str(len(books)) + ' books failed:')
+		for dirNme in failedBooks :
+			print(dirNme)
+	return failedBooks
+
+def main(argv):
+	global dirPrefix, BOOK_WORKERS, WARM_UP, PROFILE_BOOKS
+	parser = argparse.ArgumentParser(description='Enrich Emblematica Online spines and publish their books - with no command, the books of ' + BOOK_LIST_FILE)
+	parser.add_argument('--prefix', help='output root, default ' + dirPrefix)
+	parser.add_argument('--workers', type=int, help='books processed at once, default ' + str(BOOK_WORKERS))
+	parser.add_argument('--warm-up', action='store_true', help='resolve the authority lookups of the whole url list before processing its books')
+	parser.add_argument('--profile', action='store_true', help='profile each book\'s parseXML and keep the profiles of the slow and heavy ones')
+	commands = parser.add_subparsers(dest='command')
+	runCommand = commands.add_parser('run', help='process the books of url lists')
+	runCommand.add_argument('lists', nargs='*', default=[BOOK_LIST_FILE], help='url lists, json ({"urlList" : [...]}) or one url per line')
+	watchCommand = commands.add_parser('watch', help='keep running, processing url lists dropped into a queue folder or urls sent on stdin')
+	watchCommand.add_argument('--queue', default=WATCH_QUEUE_DIR, help='queue folder, default ' + WATCH_QUEUE_DIR)
+	watchCommand.add_argument('--stdin', action='store_true', help='read book urls from stdin instead of a queue folder')
+	watchCommand.add_argument('--interval', type=float, default=WATCH_INTERVAL, help='seconds between looks at the queue folder')
+	jobsCommand = commands.add_parser('jobs', help='share the books of a run between workers on several hosts through a job queue file')
+	jobsCommand.add_argument('action', choices=('add', 'work', 'status', 'retry'), help='add url lists to the queue, work on its books until it is drained, show its status, or put its failed books back')
+	jobsCommand.add_argument('lists', nargs='*', help='url lists to add')
+	jobsCommand.add_argument('--queue-file', default=JOB_QUEUE_FILE, help='job queue file, default ' + JOB_QUEUE_FILE)
+	renderCommand = commands.add_parser('render', help='regenerate the json and json-ld of books already enriched, from the xml saved in their supplementary folder')
+	renderCommand.add_argument('books', nargs='*', help='book folders under the output root, default all of them')
+	renderCommand.add_argument('--processes', type=int, help='worker processes, default ' + ('one per cpu' if RENDER_PROCESSES is None else str(RENDER_PROCESSES)))
+	importCommand = commands.add_parser('import-authorities', help='build the local authority index from bulk downloads and stop')
+	importCommand.add_argument('files', nargs='+', help='*.nt / *.nt.gz id.loc.gov downloads or VIAF cluster extracts')
+	args = parser.parse_args(argv)
+
+	if args.prefix is not None :
+		dirPrefix = args.prefix
+	if args.workers is not None :
+		BOOK_WORKERS = args.workers
+	if args.warm_up :
+		WARM_UP = True
+	if args.profile :
+		PROFILE_BOOKS = True
+
+	if args.command == 'import-authorities' :
+		importAuthorities(args.files)
+		return
+	if args.command == 'jobs' and args.action != 'work' :
+		jobQueue = JobQueue(args.queue_file)
+		if args.action == 'add' :
+			myUrls = []
+			for fleNme in args.lists :
+				myUrls.extend(readUrlList(fleNme))
+			print(str(jobQueue.add(myUrls)) + ' of ' + str(len(myUrls)) + ' books added')
+		elif args.action == 'retry' :
+			print(str(jobQueue.retryFailed()) + ' failed books queued again')
+		jobsStatus(jobQueue)
+		jobQueue.close()
+		return
+
+	try:
+		if args.command == 'watch' :
+			try:
+				if args.stdin :
+					watchStdin()
+				else :
+					watchQueue(args.queue, args.interval)
+			except KeyboardInterrupt:
+				print('stopped')
+				flushRun()
+		elif args.command == 'jobs' :
+			jobQueue = JobQueue(args.queue_file)
+			workJobs(jobQueue)
+			jobsStatus(jobQueue)
+			jobQueue.close()
+			flushRun()
+		elif args.command == 'render' :
+			renderBooks(args.books or outputBooks(), args.processes)
+			flushRun()
+		else :
+			myUrls = []
+			for fleNme in getattr(args, 'lists', [BOOK_LIST_FILE]) :
+				myUrls.extend(readUrlList(fleNme))
+			failedUrls, retryUrls = runBooks(myUrls)
+			if len(retryUrls) > 0 :
+				print('books to retry listed in ' + RETRY_LIST_FILE)
+				with open(RETRY_LIST_FILE, 'w') as fle:
+					json.dump({'urlList' : retryUrls}, fle, indent=1)
+			flushRun()
+	finally:
+		finishRun()
 
-	parseXML(spine, dirNme, fqDirNme, fileSource)
+if __name__ == '__main__':
+	main(sys.argv[1:])
 	
 
 